@@ -0,0 +1,20 @@
+# Benchmark of the parser of daemon answers against exec() of the answer for
+# a JobInfo request with status only. Usage:
+#   python benchmarks/daemonreply.py
+
+import timeit
+from jcmwave.__private.daemonreply import parse_reply
+
+for nJobs in [10, 1000, 10000]:
+    answer = "s0 = {'ReturnValue': {'Id': %r, 'Status': %r}}\n" % (
+        list(range(1, nJobs+1)), ['Running', 'Finished']*(nJobs//2))
+    def run_exec():
+        namespace = dict()
+        exec(answer.replace('\\', '\\\\'), globals(), namespace)
+        return namespace
+    assert run_exec() == parse_reply(answer)
+    nRuns = max(1, 20000//nJobs)
+    t_exec = min(timeit.repeat(run_exec, number=nRuns, repeat=3))/nRuns
+    t_parse = min(timeit.repeat(lambda: parse_reply(answer), number=nRuns, repeat=3))/nRuns
+    print('%5d jobs: exec %.1f us, parse_reply %.1f us, speedup %.1f' % (
+        nJobs, 1e6*t_exec, 1e6*t_parse, t_exec/t_parse))
@@ -0,0 +1,37 @@
+# Benchmark of the substitution plans against the substitution by re.sub()
+# with jcm_sub() for a polygon layout given by point placeholders or by a
+# point list. Only the echo of the literal block is timed. Usage:
+#   python benchmarks/jcmt2jcm_from_string.py
+
+import timeit
+import numpy as np
+from jcmwave.__private.jcmt2jcm_from_string import (jcm_echo, jcm_sub, 
+    __PLACEHOLDER, __LINE_MARKER)
+
+def jcm_echo_regex(jcm, keys):
+    jcm = __PLACEHOLDER.sub(lambda m: jcm_sub(m, keys), jcm)
+    jcm_lines = [int(line) for line in __LINE_MARKER.findall(jcm)]
+    return (__LINE_MARKER.sub('', jcm), jcm_lines)
+
+for nPoints in [100, 1000]:
+    keys = dict()
+    for ii in range(nPoints):
+        keys['x%d' % ii] = np.cos(2*np.pi*ii/nPoints)
+        keys['y%d' % ii] = np.sin(2*np.pi*ii/nPoints)
+    keys['points'] = np.array([[keys['x%d' % ii], keys['y%d' % ii]] 
+                               for ii in range(nPoints)]).ravel()
+    templates = [
+        ('placeholders', 'Polygon {\n  Points = [\n%s]\n}\n' % ''.join(
+            ['    %%(x%d)e %%(y%d)e\n' % (ii, ii) for ii in range(nPoints)])),
+        ('point list', 'Polygon {\n  Points = %(points)e\n}\n')]
+    for name, jcmt in templates:
+        # literal block with line counters as generated by __compile
+        jcm = '\n'.join(['%s# __LINE %d' % (line, il+1) 
+                         for il, line in enumerate(jcmt.split('\n'))])
+        assert jcm_echo(jcm, keys) == jcm_echo_regex(jcm, keys)
+        t_regex = min(timeit.repeat(lambda: jcm_echo_regex(jcm, keys), 
+                                    number=20, repeat=3))/20
+        t_plan = min(timeit.repeat(lambda: jcm_echo(jcm, keys), 
+                                   number=20, repeat=3))/20
+        print('%4d points, %-12s: re.sub %.0f us, plan %.0f us, speedup %.1f' % (
+            nPoints, name, 1e6*t_regex, 1e6*t_plan, t_regex/t_plan))
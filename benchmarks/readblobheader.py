@@ -0,0 +1,16 @@
+# Benchmark of the parser of blob headers. Usage:
+#   python benchmarks/readblobheader.py <file.jcm> [<file.jcm> ...]
+
+import re
+import sys
+import timeit
+from jcmwave.__private.readblobheader import readblobheader
+
+for file_name in sys.argv[1 : ]:
+    with open(file_name, 'rb') as f: 
+        blobtype = re.search(b'__BLOBTYPE__=(.*)', f.read(4096)).group(1).decode().strip()
+    def run():
+        with open(file_name, 'rb') as f: return readblobheader(f, blobtype)
+    nRuns = 200
+    t_block = min(timeit.repeat(run, number=nRuns, repeat=3))/nRuns
+    print('%s: %.1f us per header' % (file_name, 1e6*t_block))
@@ -0,0 +1,90 @@
+# Benchmarks of the resultbag: insertion of results with a rollback journal
+# and in WAL mode, reading results stored pickled and as external arrays,
+# and the text based and binary hash of keys. Usage:
+#   python benchmarks/resultbag.py
+
+import os
+import time
+import shutil
+import numpy as np
+from jcmwave.resultbag import Resultbag
+
+def benchmark(n_results = 100000, n_batch = 100):
+    # Inserts n_results results of two flux tables into resultbags with a 
+    # rollback journal (as before WAL mode) and in WAL mode, committing 
+    # each result or batches of n_batch results (e.g. all jobs finished 
+    # at a poll of jcmwave.daemon.wait). 
+    result = [{'title': 'ElectricFluxDensity', 'ElectricFlux': [
+                np.random.rand(2) + 1j*np.random.rand(2)]}]*2
+    log = {'ExitCode': 0, 'Log': {'Out': 'Finished.', 'Error': ''}}
+    for wal, batch_size, n in [(False, 1, min(n_results, 2000)), 
+                               (True, 1, n_results), (True, n_batch, n_results)]:
+        filepath = os.path.abspath('benchmark.rbg')
+        rb = Resultbag(filepath, ['radius'], wal = wal)
+        start = time.time()
+        for i0 in range(0, n, batch_size):
+            with rb.batch():
+                for i in range(i0, min(i0 + batch_size, n)):
+                    rb.add(keys = {'radius': float(i)}, result = result, log = log)
+        t = time.time() - start
+        assert rb.results.count() == n
+        rb.close()
+        print('%-16s batch %4d: %6d results in %6.2f s (%.0f results/s)' % (
+            'WAL' if wal else 'rollback journal', batch_size, n, t, n/t))
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.isfile(filepath + suffix): os.remove(filepath + suffix)
+
+
+def benchmark_key_hash(n_points = 10000):
+    # Computes the tag of keys with a polygon of n_points points by the text
+    # based and the binary hash and for the second time (memoized)
+    filepath = os.path.abspath('benchmark.rbg')
+    rb = Resultbag(filepath)
+    keys = {'radius': 1.0, 'polygon': np.random.rand(n_points, 2).tolist(),
+            'n_table': np.random.rand(n_points) + 1j*np.random.rand(n_points)}
+    for key_hash in [1, 2]:
+        rb._key_hash = key_hash
+        t = [0.0, 0.0]
+        for i in range(2):
+            start = time.time()
+            rb._tag_memo = dict()
+            rb._key_tag(keys)
+            t[0] += (time.time() - start)/2
+            start = time.time()
+            rb._key_tag(keys)
+            t[1] += (time.time() - start)/2
+        print('key hash version %d: tag %7.2f ms, memoized %5.2f ms' % (
+            key_hash, 1e3*t[0], 1e3*t[1]))
+    rb.close()
+    os.remove(filepath)
+
+
+def benchmark_arrays(n_results = 20, shape = (100, 100, 50, 3)):
+    # Stores n_results results of a flux table and a cartesian field
+    # (24 MB) pickled and as external arrays and reads the flux of all
+    # results by a new resultbag (i.e. without cached values).
+    for external_arrays in [False, True]:
+        filepath = os.path.abspath('benchmark.rbg')
+        rb = Resultbag(filepath, ['radius'], external_arrays = external_arrays)
+        with rb.batch():
+            for i in range(n_results):
+                result = [{'ElectricFlux': [np.random.rand(2)]}, 
+                          {'field': [np.full(shape, i, dtype = complex)]}]
+                rb.add(keys = {'radius': float(i)}, result = result)
+        rb.close()
+        start = time.time()
+        rb = Resultbag(filepath, ['radius'])
+        flux = [rb.get_result({'radius': float(i)})[0]['ElectricFlux'][0][0]
+                for i in range(n_results)]
+        t = time.time() - start
+        rb.close()
+        print('%-15s: database %6.1f MB, flux of %d results read in %7.1f ms' % (
+            'external arrays' if external_arrays else 'pickled', 
+            os.path.getsize(filepath)/1024**2, n_results, 1e3*t))
+        os.remove(filepath)
+        shutil.rmtree(filepath + '.arrays', ignore_errors = True)
+
+
+benchmark()
+benchmark_arrays()
+benchmark_key_hash()
@@ -0,0 +1,76 @@
+# Throughput benchmark of pipelined against serialized daemon commands with a
+# stand-in daemon in a separate process. Usage: 
+#   python benchmarks/socket_communication.py
+
+import time
+import socket
+import struct
+import threading
+import multiprocessing
+from jcmwave.__private.socket_communication import (send_message, 
+    _CommandLength2ByteArray, _recv_exactly)
+
+
+def stand_in_daemon(server, processing_time, latency):
+    """
+    Answers the commands of one connection in order like the daemon, 
+    taking processing_time seconds per command. The answers are delivered
+    with the given latency in seconds.
+    """
+    import queue
+    connection, _ = server.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    answer = "s0 = {'ReturnValue': {'Status': 'Running'}}\n".encode()
+    answer = bytes(_CommandLength2ByteArray(answer)) + answer
+    outbox = queue.Queue()
+    def deliver():
+        while True:
+            t_due = outbox.get()
+            if t_due is None: return
+            time.sleep(max(0, t_due-time.time()))
+            connection.sendall(answer)
+    sender = threading.Thread(target=deliver)
+    sender.start()
+    try:
+        while True:
+            size = struct.unpack('I', _recv_exactly(connection, 4))[0]
+            _recv_exactly(connection, size)
+            t0 = time.time()
+            while time.time()-t0 < processing_time: pass
+            outbox.put(time.time()+latency)
+    except ConnectionError: pass
+    outbox.put(None)
+    sender.join()
+
+
+if __name__=='__main__':
+    command = '\nTask {\n  JobInfo {\n    Id = [1]\n    StatusOnly = 1\n  }\n}'
+    n_commands = 1000
+    for latency in [0.0, 1e-3]:
+        for n_threads in [1, 4, 16]:
+            rates = []
+            for pipelined in [False, True]:
+                server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                server.bind(('localhost', 0))
+                server.listen(1)
+                process = multiprocessing.Process(target=stand_in_daemon, 
+                                                  args=(server, 1e-4, latency))
+                process.start()
+                client = socket.create_connection(server.getsockname())
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                serial_lock = threading.Lock()
+                def run():
+                    for i in range(n_commands//n_threads):
+                        if pipelined: send_message(client, command)
+                        else: 
+                            with serial_lock: send_message(client, command)
+                threads = [threading.Thread(target=run) for i in range(n_threads)]
+                t0 = time.time()
+                for thread in threads: thread.start()
+                for thread in threads: thread.join()
+                rates.append(n_commands/(time.time()-t0))
+                client.close()
+                process.join()
+                server.close()
+            print('latency %.1f ms, %2d threads: serialized %5.0f cmd/s, pipelined %5.0f cmd/s' % (
+                1e3*latency, n_threads, rates[0], rates[1]))
@@ -36,21 +36,23 @@ from .info import info
 from .jcmt2jcm import jcmt2jcm
 from . import nested_dict
 from .geo import geo
-from .solve import solve
+from .solve import solve, solve_many
 from .view import view
 from .edit import edit
 from .loadtable import loadtable
-from .loadcartesianfields import loadcartesianfields
+from .loadcartesianfields import loadcartesianfields, iter_cartesianfields
+from .load_many import load_many
 from .resultbag import Resultbag
 from .convert2powerflux import convert2powerflux
 from . import daemon
+if sys.version_info >= (3, 7): from . import aio
 from . import optimizer
 
 __all__ = ['startup', 'set_num_threads', 'info',
            'jcmt2jcm', 'nested_dict', 
-           'geo', 'solve', 'view', 'edit'
-           'loadtable', 'loadcartesianfields',
-           'Resultbag','daemon','call_templates',
+           'geo', 'solve', 'solve_many', 'view', 'edit'
+           'loadtable', 'loadcartesianfields', 'iter_cartesianfields', 'load_many',
+           'Resultbag','daemon','aio','call_templates',
            'convert2powerflux', 'optimizer'] 
 
 
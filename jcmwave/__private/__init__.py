@@ -62,3 +62,7 @@ from jcmwave.__private.toolerror import toolerror
 from jcmwave.__private.warning import warning
 from jcmwave.__private.readblobheader import readblobheader
 from jcmwave.__private.jcmt2jcm_from_string import jcmt2jcm_from_string
+from jcmwave.__private.resultcache import loadcache, savecache
+from jcmwave.__private.daemonreply import parse_reply
+from jcmwave.__private.filesync import write_if_changed, copy_if_changed
+from jcmwave.__private.gridcache import gridtag, fetchgrid, storegrid
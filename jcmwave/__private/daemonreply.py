@@ -0,0 +1,217 @@
+# Copyright(C) 2012 JCMwave GmbH, Berlin.
+#  All rights reserved.
+#
+# The information and source code contained herein is the exclusive property
+# of JCMwave GmbH and may not be disclosed, examined or reproduced in whole
+# or in part without explicit written authorization from JCMwave.
+#
+
+"""
+Parser of the answers of the JCMdaemon (response format 'python').
+
+An answer is a sequence of assignments ``name = value`` or
+``name[key]...[key] = value`` of python literals (dicts, lists, tuples,
+strings, numbers, True, False, None). Instead of executing the answer,
+it is decoded by the following parsers, each handling more cases than 
+the previous one:
+
+1. Answers with string keys only (the common case) are translated to JSON 
+   by replacing quotes and names and decoded by the json module. 
+2. Other answers (e.g. with integer keys or tuples) are tokenized with a 
+   single regular expression and the values are assembled directly.
+3. Answers using other syntax (e.g. complex numbers) are evaluated from 
+   their syntax tree, where only literals and the constructors dict(), 
+   list(), tuple(), float(), complex() and numpy.array() are accepted.
+"""
+
+import re
+import ast
+import json
+
+# token groups (after whitespace and comments): raw string, string with escapes, number, name, punctuation, error
+__TOKEN_RAW = re.compile(r"""(?:\s|#[^\n]*)*(?:'([^']*)'|"([^"]*)"|"""
+    r"""([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?![\w.])|"""
+    r"""([A-Za-z_]\w*)|([\[\]{}(),:=;])|(\S))""")
+__TOKEN_ESCAPED = re.compile(r"""(?:\s|#[^\n]*)*(?:'((?:[^'\\\n]|\\.)*)'|"((?:[^"\\\n]|\\.)*)"|"""
+    r"""([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?![\w.])|"""
+    r"""([A-Za-z_]\w*)|([\[\]{}(),:=;])|(\S))""")
+__NAMES = {'True': True, 'False': False, 'None': None}
+__JSON_NAMES = {'True': 'true', 'False': 'false', 'None': 'null'}
+__JSON_COMMENT = re.compile('#[^\n\x00]*')
+__JSON_NAME = re.compile(r'\b(True|False|None)\b')
+__JSON_TARGET = re.compile(r'\s*([A-Za-z_]\w*)\s*')
+__JSON_SPACE = re.compile(r'[ \t]*')
+__JSON_SEPARATOR = re.compile(r'\s*;?')
+__JSON_DECODER = json.JSONDecoder(strict=False)
+__CONSTRUCTORS = {'dict': dict, 'list': list, 'tuple': tuple,
+                  'float': float, 'complex': complex}
+
+def parse_reply(string, raw_strings=True):
+    """
+    Parses the answer of the daemon and returns a dictionary which maps the
+    assigned names to their values. If raw_strings is True, backslashes in
+    strings are not treated as escape characters.
+    """
+    try: return __parse_json(string)
+    except (ValueError, IndexError): pass
+    try: return __parse_tokens(string, raw_strings)
+    except (ValueError, IndexError): pass
+    try: return __parse_tree(string, raw_strings)
+    except (ValueError, SyntaxError, TypeError, KeyError, IndexError):
+        raise EnvironmentError('Received erroneous data from daemon.')
+
+def __parse_json(string):
+    """
+    Translates an answer without backslashes and double quotes to JSON and 
+    decodes it. Strings are split off at the single quotes, such that names
+    are only replaced outside of strings.
+    """
+    if '"' in string or '\\' in string or '\x00' in string: 
+        raise ValueError('No JSON compatible answer.')
+    parts = string.split("'")
+    if len(parts)%2 == 0: raise ValueError('Unterminated string.')
+    code = '\x00'.join(parts[0::2])
+    if '#' in code: code = __JSON_COMMENT.sub('', code)
+    code = __JSON_NAME.sub(lambda m: __JSON_NAMES[m.group(1)], code)
+    parts[0::2] = code.split('\x00')
+    text = '"'.join(parts)
+
+    namespace = dict()
+    pos = 0
+    while True:
+        m = __JSON_TARGET.match(text, pos)
+        if m is None: break
+        name = m.group(1)
+        pos = m.end()
+        path = []
+        while text.startswith('[', pos):
+            pos = __JSON_SPACE.match(text, pos+1).end()
+            key, pos = __JSON_DECODER.raw_decode(text, pos)
+            pos = __JSON_SPACE.match(text, pos).end()
+            if not text.startswith(']', pos): raise ValueError(text[pos:pos+10])
+            path.append(key)
+            pos = __JSON_SPACE.match(text, pos+1).end()
+        if not text.startswith('=', pos): raise ValueError(text[pos:pos+10])
+        pos = __JSON_SPACE.match(text, pos+1).end()
+        value, pos = __JSON_DECODER.raw_decode(text, pos)
+        __assign(namespace, name, path, value)
+        pos = __JSON_SEPARATOR.match(text, pos).end()
+    if text[pos:].strip(): raise ValueError(text[pos:pos+10])
+    return namespace
+
+def __parse_tokens(string, raw_strings):
+    pattern = __TOKEN_RAW if raw_strings else __TOKEN_ESCAPED
+    tokens = pattern.findall(string)
+    namespace = dict()
+    pos = 0
+    while pos < len(tokens):
+        name = tokens[pos][3]
+        if not name or name in __NAMES: raise ValueError(name)
+        pos += 1
+        path = []
+        while tokens[pos][4] == '[':
+            key, pos = __value(tokens, pos+1, raw_strings)
+            if tokens[pos][4] != ']': raise ValueError(tokens[pos])
+            path.append(key)
+            pos += 1
+        if tokens[pos][4] != '=': raise ValueError(tokens[pos])
+        value, pos = __value(tokens, pos+1, raw_strings)
+        __assign(namespace, name, path, value)
+        if pos < len(tokens) and tokens[pos][4] == ';': pos += 1
+    return namespace
+
+def __value(tokens, pos, raw_strings):
+    """
+    Returns the literal starting at tokens[pos] and the position after it.
+    """
+    sq, dq, number, name, punct, error = tokens[pos]
+    if punct == '{':
+        value = dict()
+        pos += 1
+        while tokens[pos][4] != '}':
+            key, pos = __value(tokens, pos, raw_strings)
+            if tokens[pos][4] != ':': raise ValueError(tokens[pos])
+            value[key], pos = __value(tokens, pos+1, raw_strings)
+            if tokens[pos][4] == ',': pos += 1
+            elif tokens[pos][4] != '}': raise ValueError(tokens[pos])
+        return value, pos+1
+    if punct == '[' or punct == '(':
+        closing = ']' if punct == '[' else ')'
+        value = list()
+        pos += 1
+        nCommas = 0
+        while tokens[pos][4] != closing:
+            item, pos = __value(tokens, pos, raw_strings)
+            value.append(item)
+            if tokens[pos][4] == ',':
+                pos += 1
+                nCommas += 1
+            elif tokens[pos][4] != closing: raise ValueError(tokens[pos])
+        if punct == '(':
+            # a parenthesized single value is not a tuple
+            if len(value) == 1 and nCommas == 0: return value[0], pos+1
+            value = tuple(value)
+        return value, pos+1
+    if number:
+        if '.' in number or 'e' in number or 'E' in number:
+            return float(number), pos+1
+        return int(number), pos+1
+    if punct or error: raise ValueError(tokens[pos])
+    if name:
+        if name in __NAMES: return __NAMES[name], pos+1
+        if (name in ('dict', 'list', 'tuple') and tokens[pos+1][4] == '(' and
+            tokens[pos+2][4] == ')'):
+            return __CONSTRUCTORS[name](), pos+3
+        raise ValueError(name)
+    string = sq or dq
+    if not raw_strings and '\\' in string:
+        string = ast.literal_eval("'" + string + "'")
+    return string, pos+1
+
+def __assign(namespace, name, path, value):
+    if len(path) == 0:
+        namespace[name] = value
+        return
+    container = namespace[name]
+    for key in path[:-1]: container = container[key]
+    container[path[-1]] = value
+
+def __parse_tree(string, raw_strings):
+    """
+    Evaluates the answer from its syntax tree (slow path).
+    """
+    if raw_strings: string = string.replace('\\', '\\\\')
+    namespace = dict()
+    for statement in ast.parse(string).body:
+        if not isinstance(statement, ast.Assign) or len(statement.targets) != 1:
+            raise ValueError('Assignment expected.')
+        target = statement.targets[0]
+        path = []
+        while isinstance(target, ast.Subscript):
+            index = target.slice
+            if isinstance(index, ast.Index): index = index.value # python<3.9
+            path.insert(0, __literal(index))
+            target = target.value
+        if not isinstance(target, ast.Name): raise ValueError('Name expected.')
+        __assign(namespace, target.id, path, __literal(statement.value))
+    return namespace
+
+def __literal(node):
+    if isinstance(node, ast.Dict):
+        if None in node.keys: raise ValueError('Dictionary unpacking.')
+        return dict([(__literal(k), __literal(v)) for k, v in zip(node.keys, node.values)])
+    if isinstance(node, ast.List): return [__literal(e) for e in node.elts]
+    if isinstance(node, ast.Tuple): return tuple([__literal(e) for e in node.elts])
+    if isinstance(node, ast.Call):
+        func = node.func
+        if (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and
+            func.value.id in ('np', 'numpy') and func.attr == 'array'):
+            import numpy as np
+            constructor = np.array
+        elif isinstance(func, ast.Name) and func.id in __CONSTRUCTORS:
+            constructor = __CONSTRUCTORS[func.id]
+        else: raise ValueError('Call of %s.' % ast.dump(func))
+        if len(node.keywords) > 0: raise ValueError('Keyword arguments.')
+        return constructor(*[__literal(arg) for arg in node.args])
+    # constants, signed and complex numbers
+    return ast.literal_eval(node)
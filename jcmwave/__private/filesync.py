@@ -0,0 +1,40 @@
+# Copyright(C) 2012 JCMwave GmbH, Berlin.
+#  All rights reserved.
+#
+# The information and source code contained herein is the exclusive property
+# of JCMwave GmbH and may not be disclosed, examined or reproduced in whole
+# or in part without explicit written authorization from JCMwave.
+#
+
+"""
+Writing of .jcm input files, which leaves files with unchanged content 
+untouched. Their modification times are kept, such that JCMgeo and JCMsolve 
+do not regenerate data derived from them (e.g. meshes).
+"""
+
+import os
+import shutil
+import filecmp
+
+def write_if_changed(file_name, content):
+    """
+    Writes content to the text file file_name unless the file already has
+    this content. Returns True if the file was written.
+    """
+    try:
+        # a file has at least as many bytes as characters
+        if os.path.getsize(file_name) >= len(content):
+            with open(file_name, 'r') as f:
+                if f.read() == content: return False
+    except (OSError, ValueError): pass # not existing or not decodable
+    with open(file_name, 'w') as f: f.write(content)
+    return True
+
+def copy_if_changed(src, dst):
+    """
+    Copies the file src to dst unless dst has the same content. Returns True
+    if the file was copied.
+    """
+    if os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False): return False
+    shutil.copyfile(src, dst)
+    return True
@@ -0,0 +1,115 @@
+# Copyright(C) 2012 JCMwave GmbH, Berlin.
+#  All rights reserved.
+#
+# The information and source code contained herein is the exclusive property
+# of JCMwave GmbH and may not be disclosed, examined or reproduced in whole
+# or in part without explicit written authorization from JCMwave.
+#
+
+"""
+Persistent cache of grid.jcm files generated by JCMgeo.
+
+A grid is stored in the directory ``<cache_dir>/<tag>``, where the tag is
+the hash of the JCMgeo input files (layout.jcm, triangulator.jcm, .gds files)
+and the version of JCMgeo. On a hit the grid is copied into the working 
+directory, unless it already contains the same grid. The grid is not 
+hard-linked: a linked grid would have the (older) modification time of the 
+cache entry, such that JCMsolve and JCMgeo, which compare modification times 
+to decide whether a project is up-to-date, would regard it as outdated and 
+rewrite it in place, i.e. change the cached grid for all other users. The 
+modification time of an entry directory marks its last use; the least 
+recently used entries are removed when the total size exceeds the given limit.
+"""
+
+import os
+import glob
+import filecmp
+import shutil
+import hashlib
+import jcmwave.__private as __private
+from jcmwave.__private.warning import warning
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.jcmwave', 'grid_cache')
+DEFAULT_MAX_BYTES = 2*1024**3
+
+def gridtag(working_dir):
+    """
+    Returns the tag of the JCMgeo input in working_dir or None if there
+    is no layout.jcm.
+    """
+    md5 = hashlib.md5()
+    md5.update(('%s %s %s' % (__private.version, __private.buildtag,
+                              __private.JCMgeo)).encode())
+    input_files = [os.path.join(working_dir, 'layout.jcm'),
+                   os.path.join(working_dir, 'triangulator.jcm')]
+    input_files += sorted(glob.glob(os.path.join(working_dir, '*.gds')))
+    for iF, input_file in enumerate(input_files):
+        try:
+            with open(input_file, 'rb') as f: data = f.read()
+        except (IOError, OSError):
+            if iF == 0: return None
+            continue
+        md5.update(('\n%s %d\n' % (os.path.basename(input_file), len(data))).encode())
+        md5.update(data)
+    return md5.hexdigest()
+
+def fetchgrid(cache_dir, tag, grid_file):
+    """
+    Copies the cached grid with the given tag to grid_file. Returns False if
+    there is no cached grid.
+    """
+    entry = os.path.join(cache_dir, tag)
+    cached = os.path.join(entry, 'grid.jcm')
+    if not os.path.isfile(cached): return False
+    try:
+        if not os.path.isfile(grid_file):
+            shutil.copyfile(cached, grid_file)
+        elif os.path.samefile(cached, grid_file):
+            # replace a hard link into the cache by a copy with the same
+            # modification time, such that the cached grid is never rewritten
+            os.remove(grid_file)
+            shutil.copy2(cached, grid_file)
+        elif not filecmp.cmp(cached, grid_file, shallow=False):
+            # the copy is newer than results computed from the previous grid,
+            # an unchanged grid keeps its modification time
+            os.remove(grid_file)
+            shutil.copyfile(cached, grid_file)
+        os.utime(entry, None)
+    except OSError: return False
+    return True
+
+def storegrid(cache_dir, tag, grid_file, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Stores a copy of grid_file in the cache and removes the least recently
+    used grids exceeding max_bytes. Failures only issue a warning.
+    """
+    entry = os.path.join(cache_dir, tag)
+    tmp = '%s.%d.tmp' % (entry, os.getpid())
+    try:
+        if not os.path.isdir(cache_dir): os.makedirs(cache_dir)
+        if os.path.isdir(tmp): shutil.rmtree(tmp)
+        os.mkdir(tmp)
+        shutil.copyfile(grid_file, os.path.join(tmp, 'grid.jcm'))
+        if not os.path.isdir(entry): os.rename(tmp, entry)
+    except OSError as e:
+        if not os.path.isdir(entry): # not stored by another process meanwhile
+            warning('Cannot store grid in cache %s: %s' % (cache_dir, e))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    __evict(cache_dir, max_bytes)
+
+def __evict(cache_dir, max_bytes):
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.endswith('.tmp'): continue
+        try: entries.append((os.path.getmtime(entry),
+                             os.path.getsize(os.path.join(entry, 'grid.jcm')), entry))
+        except OSError: pass
+    entries.sort()
+    total = sum([size for _, size, _ in entries])
+    # the most recently used grid is kept in any case
+    for _, size, entry in entries[0 : -1]:
+        if total <= max_bytes: break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
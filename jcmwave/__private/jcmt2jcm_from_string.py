@@ -4,10 +4,24 @@ import re
 import string
 import sys
 import traceback
+import hashlib
+import threading
 from jcmwave.__private import smartpath
 import jcmwave
 import copy
 
+# compiled templates: (content hash, file path) -> (jcmpyo, jcmpy)
+__compiled = dict()
+__compiled_lock = threading.Lock()
+__COMPILED_MAX = 256
+
+# substitution plans of the literal blocks: block -> (fragments, placeholders, lines)
+__plans = dict()
+__PLANS_MAX = 4096
+__PLACEHOLDER = re.compile('[%]([?]?)\(([^)]*)\)([\d]{0,2})([sdiefg])')
+__LINE_MARKER = re.compile('# __LINE (\d*)')
+__MISSING = object()
+
 
 
 def jcmt2jcm_from_string(jcmt, keys, jcmt_file=None):
@@ -15,6 +29,45 @@ def jcmt2jcm_from_string(jcmt, keys, jcmt_file=None):
         jcmt_file="__from_string"
     jcmt_orig = jcmt
 
+    # the template is parsed and compiled only once, keys are substituted per call
+    tag = (hashlib.md5(jcmt.encode()).digest(), jcmt_file)
+    compiled = __compiled.get(tag)
+    if compiled is None: 
+        compiled = __compile(jcmt, jcmt_file)
+        with __compiled_lock:
+            if len(__compiled) >= __COMPILED_MAX: 
+                del __compiled[next(iter(__compiled))]
+            __compiled[tag] = compiled
+    (jcmpyo, jcmpy) = compiled
+
+    # the keys are cloned lazily, only values accessed by the script are copied
+    try: (jcm, jcm_lines)=exec_jcmpyo(jcmpyo, CopyOnWriteKeys(keys))
+    except __SubstitutionError as subError:
+      raise SubstitutionError(jcmt_file, None, subError.pos, 
+                      jcmt_orig, str(subError)) 
+    except Exception as ex:
+      (type, msg, tb) = sys.exc_info()
+      tb = traceback.format_tb(tb); tb.reverse()
+      for jcmpy_trace in tb:
+          if jcmpy_trace.count('<jcmpy>'): break
+      line_jcmpy = int(re.search('line (\d*),',  jcmpy_trace).group(1))
+      line = int(re.search('# __LINE (\d*)', jcmpy.split('\n')[line_jcmpy-1]).group(1));
+      raise Exception(error_message(jcmt_file, None, (line, None), jcmt_orig, msg))
+
+    # add line counts to JCMwaveGlobal for backtracking
+    backtrace = dict()
+    backtrace['jcmt'] = os.path.abspath(jcmt_file)
+    backtrace['lines'] = jcm_lines
+
+    return [jcm,backtrace]
+
+def __compile(jcmt, jcmt_file):
+    """
+    Transforms the template into a jcmpy script and compiles it. Returns
+    the code object and the script (needed for the line backtrace of errors).
+    """
+    jcmt_orig = jcmt
+
     #  fix window's line ends
     jcmt = re.sub('\r\n',' \n', jcmt);
 
@@ -86,28 +139,7 @@ def jcmt2jcm_from_string(jcmt, keys, jcmt_file=None):
         line_jcmpy = int(m.group(2))
         line = int(re.search('# __LINE (\d*)', jcmpy.split('\n')[line_jcmpy-1]).group(1));
         raise Exception(error_message(jcmt_file, None, (line, None), jcmt_orig, msg))
-
-    #(jcm, jcm_lines)=exec_jcmpyo(jcmpyo, copy.deepcopy(keys))
-
-    try: (jcm, jcm_lines)=exec_jcmpyo(jcmpyo, copy.deepcopy(keys))
-    except __SubstitutionError as subError:
-      raise SubstitutionError(jcmt_file, None, subError.pos, 
-                      jcmt_orig, str(subError)) 
-    except Exception as ex:
-      (type, msg, tb) = sys.exc_info()
-      tb = traceback.format_tb(tb); tb.reverse()
-      for jcmpy_trace in tb:
-          if jcmpy_trace.count('<jcmpy>'): break
-      line_jcmpy = int(re.search('line (\d*),',  jcmpy_trace).group(1))
-      line = int(re.search('# __LINE (\d*)', jcmpy.split('\n')[line_jcmpy-1]).group(1));
-      raise Exception(error_message(jcmt_file, None, (line, None), jcmt_orig, msg))
-
-    # add line counts to JCMwaveGlobal for backtracking
-    backtrace = dict()
-    backtrace['jcmt'] = os.path.abspath(jcmt_file)
-    backtrace['lines'] = jcm_lines
-
-    return [jcm,backtrace]
+    return (jcmpyo, jcmpy)
 
 def tolist(data, nTypes): 
 
@@ -126,69 +158,123 @@ def tolist(data, nTypes):
 
 
 def jcm_sub(m, keys):  
-    import numpy
-    import numpy as np
+    opt, key, prec, type = m.groups()
+    placeholder = __placeholder(m.start(), m.group(0), opt, key, prec, type)
+    return __substitute(placeholder, keys)
 
-    opt = m.group(1)
-    key = m.group(2)
-    prec = m.group(3)
-    type = m.group(4)
 
-    try: value=jcmwave.nested_dict.get(keys, key) 
+def __placeholder(pos, text, opt, key, prec, type):
+    """
+    Returns the descriptor of a placeholder %(key)<prec><type> at position pos:
+    (pos, text, optional, path, key, type, fmt, fmt_c, nTypes, type_)
+    """
+    fmt = fmt_c = None
+    if type=='d' or type=='i': nTypes = (int,); type_='an integer'; fmt = '%d';
+    elif type!='s':
+       nTypes = (int,float,complex,); type_= 'a float'
+       if len(prec)==0: prec='15'; type='g'
+       fmt = '%%.%s%s' % (prec, type);
+       fmt_c = '(%s, %s) ' % (fmt, fmt)
+       fmt+=' ';
+    else: nTypes = type_ = None
+    return (pos, text, opt=='?', tuple(key.split('.')), key, type, fmt, fmt_c, 
+            nTypes, type_)
+
+
+def __substitute(placeholder, keys):
+    """
+    Returns the string substituting the placeholder for the given keys.
+    """
+    (pos, text, optional, path, key, conversion, fmt, fmt_c, nTypes, type_) = placeholder
+
+    try: value = __lookup(keys, path)
     except:
-      if opt=='?': return m.group(0)
-      subError =  __SubstitutionError(m.start(), 'No value provided for key `%s`.' % (key,))
+      if optional: return text
+      subError =  __SubstitutionError(pos, 'No value provided for key `%s`.' % (key,))
       subError.__cause__ = subError
       raise subError
 
-    if type=='s':
+    if conversion=='s':
         if not isinstance(value,str):
-            raise __SubstitutionError(m.start(), 'Value for key `%s` not a string.' % (key,))
+            raise __SubstitutionError(pos, 'Value for key `%s` not a string.' % (key,))
         return value
+
+    # scalar floats (most common case)
+    if fmt_c is not None and (isinstance(value, float) or type(value) is int):
+        return fmt[0 : -1] % (value,)
+
+    import numpy
+    import numpy as np
     
     if isinstance(value, (np.matrix, np.ndarray)) and len(value.shape)==2:
          return '[%s]' % (';\n'.join([str(value[ii]).strip('[]') for ii in range(len(value))]),)
      
-    if type=='d' or type=='i' and isinstance(value, (int,np.int64)): return str(value)
-
+    if conversion=='d' or conversion=='i' and isinstance(value, (int,np.int64)): return str(value)
 
-    if type=='d' or type=='i': nTypes = (int,); type_='an integer'; fmt = '%d';
-    
-    else: 
-       nTypes = (int,float,complex,); type_= 'a float'
-       if len(prec)==0: prec='15'; type='g'
-       fmt = '%%.%s%s' % (prec, type);
-       fmt_c = '(%s, %s) ' % (fmt, fmt)
-       fmt+=' ';
     value = tolist(value, nTypes);
         
     if value is None: 
          what = '%s' % type_
-         raise __SubstitutionError(m.start(), 'Value for key `%s` not %s.' % (key, what))
-
-    value_string = str();
-    for iV in value:
-         if iV.imag!=0: 
-              value_string+= fmt_c % (iV.real, iV.imag)
-         else: 
-             value_string+=fmt % (iV.real,)
+         raise __SubstitutionError(pos, 'Value for key `%s` not %s.' % (key, what))
+
+    value_string = ''.join([fmt_c % (iV.real, iV.imag) if iV.imag!=0 
+                            else fmt % (iV.real,) for iV in value])
     value_string = value_string[0 : -1]
     if len(value)>1 or len(value)==0: value_string = '[%s]' % value_string;
     return value_string
 
 
+def __lookup(keys, path):
+    """
+    Returns the value at path in the nested keys. Values shared by a 
+    CopyOnWriteKeys proxy are read without being cloned.
+    """
+    data = keys
+    for elem in path:
+        if not isinstance(data, dict): raise KeyError(elem)
+        data = dict.get(data, elem, __MISSING)
+        if data is __MISSING: raise KeyError(elem)
+    return data
+
+
+def __plan(jcm):
+    """
+    Splits a literal block of a template once into static fragments (without 
+    line markers) and placeholder descriptors. Returns the fragments, the 
+    placeholders and the template lines of the block.
+    """
+    fragments = list()
+    placeholders = list()
+    pos = 0
+    for m in __PLACEHOLDER.finditer(jcm):
+        fragments.append(__LINE_MARKER.sub('', jcm[pos : m.start()]))
+        placeholders.append(__placeholder(m.start(), m.group(0), *m.groups()))
+        pos = m.end()
+    fragments.append(__LINE_MARKER.sub('', jcm[pos : ]))
+
+    markers = __LINE_MARKER.findall(jcm)
+    if len(markers)>0:
+       first_line = int(markers[0])
+       jcm_lines = range(first_line, first_line+len(markers))
+    else: jcm_lines = range(0)
+    return (fragments, placeholders, jcm_lines)
 
 
 def jcm_echo(jcm, keys):
-
-    import numpy
-    import numpy as np
-
-    jcm_lines = list();
-    if len(jcm)==0: return (jcm, jcm_lines)
+    # the literal blocks are constants of the compiled template, such that 
+    # each block is split into fragments and placeholders only once
+    plan = __plans.get(jcm)
+    if plan is None:
+        plan = __plan(jcm)
+        if len(__plans) >= __PLANS_MAX: __plans.clear()
+        __plans[jcm] = plan
+    (fragments, placeholders, jcm_lines) = plan
+
+    parts = [fragments[0]]
     try:
-       jcm = re.sub('[%]([?]?)\(([^)]*)\)([\d]{0,2})([sdiefg])', 
-                    lambda m: jcm_sub(m, keys), jcm);
+       for placeholder, fragment in zip(placeholders, fragments[1 : ]):
+           parts.append(__substitute(placeholder, keys))
+           parts.append(fragment)
     except __SubstitutionError as subErr:
         pos_jcm = subErr.pos_jcm
         line = re.search('(.*)# __LINE (\d*)', jcm[pos_jcm : -1])
@@ -198,14 +284,7 @@ def jcm_echo(jcm, keys):
         subErr.__cause__ =subErr
         raise subErr
 
-    jcm_lines = re.findall('# __LINE \d*', jcm)
-    if len(jcm_lines)>0:
-       first_line = int(re.search('# __LINE (\d*)', jcm).group(1)) 
-       jcm_lines  = list(range(first_line, first_line+len(jcm_lines)))
-    else: jcm_lines = list() 
-
-    jcm = re.sub('# __LINE \d*', '', jcm);
-    return (jcm, jcm_lines)
+    return (''.join(parts), list(jcm_lines))
 
 
 
@@ -221,6 +300,85 @@ def exec_jcmpyo(jcmpyo, keys):
     jcm_lines = jcmNameSpaceL['jcm_lines']
     return (jcm, jcm_lines)
 
+class CopyOnWriteKeys(dict):
+    """
+    Copy-on-write proxy of the keys passed to the script of a template.
+    Values are shared with the original keys until they are accessed by
+    the script, e.g. ``keys['radius']`` or ``keys.items()``. Mutable values 
+    are cloned on their first access (nested dictionaries are wrapped in a 
+    proxy), such that the original keys are never changed and large arrays 
+    which are only substituted are never copied.
+    """
+    __IMMUTABLE = (int, float, complex, str, bytes, type(None))
+
+    def __init__(self, keys):
+        dict.__init__(self, keys)
+        self.__shared = set([k for k, v in dict.items(self) 
+                             if not isinstance(v, self.__IMMUTABLE)])
+
+    def __clone(self, key):
+        if key in self.__shared:
+            self.__shared.discard(key)
+            value = dict.__getitem__(self, key)
+            if type(value) is dict: value = type(self)(value)
+            else: value = copy.deepcopy(value)
+            dict.__setitem__(self, key, value)
+
+    def __getitem__(self, key):
+        self.__clone(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.__shared.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.__shared.discard(key)
+        dict.__delitem__(self, key)
+
+    def __iter__(self):
+        # dict(keys) and keys.update(...) use __getitem__ instead of copying
+        # the stored values when __iter__ is overridden
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        self.__clone(key)
+        return dict.get(self, key, default)
+
+    def setdefault(self, key, default=None):
+        self.__clone(key)
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *default):
+        self.__clone(key)
+        self.__shared.discard(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        if len(self)==0: raise KeyError('popitem(): dictionary is empty')
+        key = list(dict.keys(self))[-1]
+        return (key, self.pop(key))
+
+    def values(self):
+        return [self[k] for k in dict.keys(self)]
+
+    def items(self):
+        return [(k, self[k]) for k in dict.keys(self)]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __or__(self, other):
+        result = dict(self)
+        result.update(other)
+        return result
+
+    def __reduce__(self):
+        # pickle and copy.deepcopy() restore a plain dictionary, since a
+        # dict subclass is filled by __setitem__ before __init__ is called
+        return (dict, (dict(self.items()),))
+
+
 def error_message(jcmt_file, jcmt, pos, jcmt_orig, msg):
     if jcmt is not None:
         jcmt_ = jcmt[0 : pos]
@@ -11,60 +11,106 @@
 
 
 import re
-import array 
 from jcmwave import nested_dict
 
 
+# precompiled patterns of the header parser
+__HEADER_END = re.compile(b'\n[*]/\r?\n')
+__HEADER_END_EOF = re.compile(b'\n[*]/\r?$')
+__ENTRY = re.compile('(<[IFS]>)?(.*)=(.*)')
+__INDEX = re.compile('(_)(\d{1,})')
+__DERIVATIVE = re.compile('d\((.*)\)_(.*)')
+__CHUNK_SIZE = 8192
+
+# parsed key paths of header entries 
+__key_cache = dict()
+
 def readblobheader(f, blobtype):
-    import numpy as np
-    headerstart = f.readline().decode()
-    headerstart=headerstart.replace('\r\n', '').replace('\n', '')
+    """
+    Reads the header of a JCM blob starting at the current position of the 
+    file object f. The complete header block is read at once and parsed in
+    a single pass. On return, f is positioned at the beginning of the data 
+    section.
+    """
+    start = f.tell()
+    block = f.read(__CHUNK_SIZE)
+    while True:
+        m = __HEADER_END.search(block)
+        if m is not None: break
+        chunk = f.read(__CHUNK_SIZE)
+        if len(chunk)==0:
+            m = __HEADER_END_EOF.search(block)
+            if m is None: raise Exception('Missing header end')
+            break
+        block += chunk
+    end = m.end()
+
+    lines = block[0 : m.start()].decode().split('\n')
+    headerstart = lines[0]
+    if headerstart.endswith('\r'): headerstart = headerstart[0 : -1]
     if headerstart.replace(' ', '')!='/*<BLOBHead>':
         raise Exception('Missing header')
+
+    # collect all values of a dictionary path, then set them at once
+    entries = dict()
+    for headerentry in lines[1 : ]:
+        if headerentry.endswith('\r'): headerentry = headerentry[0 : -1]
+        keyValue = __ENTRY.match(headerentry)
+        type = keyValue.group(1)
+        if type is None: type = '<S>'
+        key = keyValue.group(2)
+        value = keyValue.group(3)
+        if type=='<I>': value = int(value)
+        elif type=='<F>': value = float(value)
+
+        try: (path, index, complex_) = __key_cache[(type, key)]
+        except KeyError:
+            (path, index, complex_) = __parsekey(type, key, blobtype)
+            if len(__key_cache)>10000: __key_cache.clear()
+            __key_cache[(type, key)] = (path, index, complex_)
+
+        if path==('__BLOBTYPE__',) and value!=blobtype:
+            raise TypeError('Wrong file format. `%s` expected' % (blobtype,))
+        if complex_==2: value*=1j
+
+        try: entries[path].append((index, value, type, complex_))
+        except KeyError: entries[path] = [(index, value, type, complex_)]
+
     header = dict()
-    while True:
-        headerentry = f.readline().decode()
-        headerentry = headerentry.replace('\r\n', '').replace('\n', '')
-        if headerentry=='*/': break
-        dealentry(f, blobtype, header, headerentry)    
+    for path, values in entries.items():
+        nested_dict.set(header, list(path), __mergevalues(values))
+
     if header['__MODE__']=='BINARY0':
-       zero = array.array('B')
-       zero.fromfile(f, 1);
-       if not zero[0]==48: raise RuntimeError('file corrupted!')
+       if end < len(block): zero = block[end]
+       else:
+           zero = f.read(1)
+           zero = zero[0] if len(zero)==1 else None
+       if not zero==48: raise RuntimeError('file corrupted!')
+       end+=1
        header['__MODE__']='BINARY'
+    f.seek(start+end)
        
     return header
-     
-def dealentry(f, blobtype, header, headerentry):
-    
-    import numpy as np
-    keyValue=re.search('(<[IFS]>)?(.*)=(.*)', headerentry)
-    if keyValue.group(1) is None: type='<S>'
-    else: type=keyValue.group(1)
-    key=keyValue.group(2) 
-    key=re.sub('(_)(\d{1,})', lambda m: ':%s' % (m.group(2),), key) 
-    value=keyValue.group(3)    
-
-    if key[0]=='_' and key=='__BLOBTYPE__' and value!=blobtype:
-        raise TypeError('Wrong file format. `%s` expected' % (blobtype,))
-    
+
+def __parsekey(type, key, blobtype):
+    """
+    Turns a header key into a path of the nested header dictionary. 
+    Returns the path, the vector index (-1 for scalars) and a flag 
+    for real (1) and imaginary (2) parts of complex values.
+    """
+    key = __INDEX.sub(lambda m: ':%s' % (m.group(2),), key)
+
     # Placeholder <DerivativeSep> serves as split indicator to turn the key into
     # a path of the nested dict
     def placeholder(m): return 'd_%s<DerivativeSep>%s' % (m.group(2), m.group(1))
-    key = re.sub('d\((.*)\)_(.*)', placeholder, key)
-    key = re.sub('d\((.*)\)_(.*)', placeholder, key)
-    #def mark_derivative(k):
-    #    return re.sub('d\((.*)\)_(.*)', lambda m: 'd_%s<DerivativeSep>%s' % (
-    #    m.group(2), m.group(1)), k);
-    #key = mark_derivative(mark_derivative(key));
-            
+    key = __DERIVATIVE.sub(placeholder, key)
+    key = __DERIVATIVE.sub(placeholder, key)
+
     key=key.split(':')
     for iK in range(0, len(key)): 
        try: key[iK] = int(key[iK])-1
        except: pass
-    if type=='<I>': value = int(value)
-    elif type=='<F>': value = float(value)
-     
+
     for iK in range(len(key)-1, -1, -1):
        if not isinstance(key[iK], int):
           final_key = key[iK]
@@ -76,15 +122,14 @@ def dealentry(f, blobtype, header, headerentry):
 
     if index!=-1: final_key = final_key[0 : -1]
 
-    complex = False
+    complex_ = 0
     if type=='<F>':
       if final_key.count('Real'):
         final_key = final_key.replace('Real', '');
-        complex=True
+        complex_ = 1
       elif final_key.count('Imag'):
-        value*=1j
         final_key = final_key.replace('Imag', '');
-        complex=True
+        complex_ = 2
     key[iK] = final_key
 
     #split key array elements at <DerivativeSep>
@@ -92,29 +137,32 @@ def dealentry(f, blobtype, header, headerentry):
     for k in key:
         try: path += k.split('<DerivativeSep>')
         except: path += [k]
+    return (tuple(path), index, complex_)
 
-    value_old = None
-    try: value_old = nested_dict.get(header, path)
-    except: pass
-
-    if value_old is None: nested_dict.set(header, path, value);
-    else:
-       if index==-1: 
-           nested_dict.set(header, path, value_old+value)
-           return
-        
-       if type=='<I>': dtype='int32'
-       elif complex: dtype='complex128'
-       else: dtype='float64'
-       if isinstance(value_old, np.ndarray) and value_old.dtype=='complex128':
-          dtype='complex128'
-       len_old = 1
-       if isinstance(value_old, np.ndarray): len_old=value_old.shape[0]
-       len_new = max(index+1, len_old)
-       value_new=np.ndarray([len_new, 1], dtype=dtype); value_new.fill(0.0);
-       value_new[0 : len_old, 0 : 1]=value_old
-       value_new[index, 0] += value 
-       nested_dict.set(header, path, value_new)
-
-    
-
+def __mergevalues(values):
+    """
+    Merges all values of a header path. Repeated scalar entries are summed 
+    up (e.g. real and imaginary parts), vector components are collected in 
+    a (n x 1) numpy array.
+    """
+    import numpy as np
+    value = values[0][1]
+    if len(values)==1: return value
+    vector = None
+    dtype = None
+    dtype_old = None
+    for (index, v, type, complex_) in values[1 : ]:
+        if index==-1:
+           if vector is None: value = value+v
+           else: vector = [vector_i+v for vector_i in vector]
+           continue
+        if type=='<I>': dtype='int32'
+        elif complex_: dtype='complex128'
+        else: dtype='float64'
+        if vector is None: vector = [value]
+        elif dtype_old=='complex128': dtype='complex128'
+        dtype_old = dtype
+        if index>=len(vector): vector.extend([0]*(index+1-len(vector)))
+        vector[index]+=v
+    if vector is None: return value
+    return np.array(vector, dtype=dtype).reshape(len(vector), 1)
@@ -0,0 +1,133 @@
+# Copyright(C) 2012 JCMwave GmbH, Berlin.
+#  All rights reserved.
+#
+# The information and source code contained herein is the exclusive property
+# of JCMwave GmbH and may not be disclosed, examined or reproduced in whole
+# or in part without explicit written authorization from JCMwave.
+#
+
+"""
+Sidecar cache of loaded .jcm result files.
+
+The loaded data is stored next to the result file, either as directory
+``<file_name>.cache`` with one .npy file per array (can be reopened memory-mapped)
+or as compressed archive ``<file_name>.npz``. The non-array part of the result
+(nested dictionaries, lists, titles, header values and small arrays) is 
+pickled into the array 'meta'. The cache is valid as long as size and modification time
+of the result file and the load options match.
+"""
+
+import os
+import shutil
+import pickle
+from jcmwave.__private.warning import warning
+
+__VERSION = 1
+__INLINE_BYTES = 65536 # smaller arrays are pickled into 'meta'
+
+class __ArrayRef(object):
+    def __init__(self, name, shape=None, matrix=False):
+        self.name = name
+        self.shape = shape # shape of a broadcast view
+        self.matrix = matrix
+
+def cachepath(file_name, compressed):
+    if compressed: return file_name + '.npz'
+    else: return file_name + '.cache'
+
+def __stamp(file_name):
+    stat = os.stat(file_name)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def __split(data, arrays):
+    """
+    Replaces numpy arrays in data by references and collects them in arrays.
+    """
+    import numpy as np
+    if isinstance(data, dict):
+        return dict([(k, __split(v, arrays)) for k, v in data.items()])
+    if isinstance(data, list):
+        return [__split(v, arrays) for v in data]
+    if isinstance(data, np.ndarray) and data.dtype != object:
+        if data.nbytes < __INLINE_BYTES:
+            if isinstance(data, np.matrix): return np.asmatrix(data)
+            return np.array(data)
+        name = 'a%d' % len(arrays)
+        if data.ndim>0 and 0 in data.strides:
+            # broadcast view (e.g. lazy grid): store the compact base only
+            base = data[tuple(slice(None) if s else slice(0, 1)
+                              for s in data.strides)]
+            arrays[name] = np.ascontiguousarray(base)
+            return __ArrayRef(name, data.shape)
+        arrays[name] = np.asarray(data)
+        return __ArrayRef(name, matrix=isinstance(data, np.matrix))
+    return data
+
+def __join(data, arrays):
+    import numpy as np
+    if isinstance(data, dict):
+        return dict([(k, __join(v, arrays)) for k, v in data.items()])
+    if isinstance(data, list):
+        return [__join(v, arrays) for v in data]
+    if isinstance(data, __ArrayRef):
+        array = arrays[data.name]
+        if data.shape is not None: array = np.broadcast_to(array, data.shape)
+        if data.matrix: array = np.asmatrix(array)
+        return array
+    return data
+
+def loadcache(file_name, options, compressed=False, mmap=False):
+    """
+    Returns the cached result of file_name loaded with the given options,
+    or None if there is no valid cache.
+    """
+    import numpy as np
+    path = cachepath(file_name, compressed)
+    try:
+        if compressed:
+            with np.load(path) as npz:
+                meta = pickle.loads(npz['meta'].tobytes())
+                if meta['stamp'] != __stamp(file_name): return None
+                if meta['options'] != options or meta['version'] != __VERSION: return None
+                arrays = dict([(name, npz[name]) for name in meta['arrays']])
+        else:
+            meta = pickle.loads(np.load(os.path.join(path, 'meta.npy')).tobytes())
+            if meta['stamp'] != __stamp(file_name): return None
+            if meta['options'] != options or meta['version'] != __VERSION: return None
+            mmap_mode = 'r' if mmap else None
+            arrays = dict([(name, np.load(os.path.join(path, name + '.npy'),
+                                          mmap_mode=mmap_mode))
+                           for name in meta['arrays']])
+    except (OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError):
+        return None
+    return __join(meta['data'], arrays)
+
+def savecache(file_name, options, data, compressed=False):
+    """
+    Stores data loaded from file_name with the given options in the cache.
+    Failures (e.g. a read-only results directory) only issue a warning.
+    """
+    import numpy as np
+    arrays = dict()
+    meta = dict(version=__VERSION, stamp=__stamp(file_name), options=options,
+                data=__split(data, arrays), arrays=sorted(arrays.keys()))
+    meta = np.frombuffer(pickle.dumps(meta, pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+    path = cachepath(file_name, compressed)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        if compressed:
+            with open(tmp, 'wb') as f: np.savez_compressed(f, meta=meta, **arrays)
+            os.replace(tmp, path)
+        else:
+            if os.path.isdir(tmp): shutil.rmtree(tmp)
+            os.mkdir(tmp)
+            np.save(os.path.join(tmp, 'meta.npy'), meta)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), array)
+            if os.path.isdir(path): shutil.rmtree(path)
+            os.rename(tmp, path)
+    except OSError as e:
+        warning('Cannot write cache of %s: %s' % (file_name, e))
+        if os.path.isdir(tmp): shutil.rmtree(tmp, ignore_errors=True)
+        elif os.path.isfile(tmp): os.remove(tmp)
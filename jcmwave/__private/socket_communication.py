@@ -19,28 +19,137 @@ import re # regular expression parsing
 from subprocess import Popen
 import socket # TCP communication
 import struct
+import collections
+import weakref
+import select
 from jcmwave.__private import socket_lock
-from jcmwave.__private.warning import warning
+
+
+class _Channel(object):
+    """
+    Pipelining state of a socket. The daemon answers the commands of a 
+    connection in the order they were sent. Each command expecting an 
+    answer gets a consecutive request id, which is queued in pending. The 
+    thread holding recv_lock reads the next answers and assigns them to 
+    the queued request ids in order. Waiters which cannot block on 
+    recv_lock (e.g. coroutines) register a callback in release_callbacks, 
+    which is called whenever recv_lock is released. The answers of 
+    requests whose waiter was cancelled are dropped when they arrive.
+    """
+    def __init__(self):
+        self.send_lock = threading.Lock()
+        self.recv_lock = threading.Lock()
+        self.answers_lock = threading.Lock()
+        self.release_callbacks = set()
+        self.pending = collections.deque()
+        self.answers = dict() # request id -> answer
+        self.discarded = set() # request ids of answers nobody waits for
+        self.next_id = 0
+        self.error = None
+
+    def release_recv_lock(self):
+        self.recv_lock.release()
+        for callback in list(self.release_callbacks): callback()
+
+    def store_answer(self, answer):
+        # called by the holder of recv_lock for the next received answer
+        request_id = self.pending.popleft()
+        with self.answers_lock:
+            if request_id in self.discarded: self.discarded.discard(request_id)
+            else: self.answers[request_id] = answer
+
+    def discard_answer(self, request_id):
+        with self.answers_lock:
+            if self.answers.pop(request_id, None) is None: 
+                self.discarded.add(request_id)
+
+_channels = weakref.WeakKeyDictionary()
+
+def _channel(socket):
+    with socket_lock:
+        channel = _channels.get(socket)
+        if channel is None:
+            channel = _channels[socket] = _Channel()
+    return channel
 
 
 def send_message(socket, message, get_answer=True):
     """
     Sends message via socket
     Returns the answer sent via the socket
+
+    The socket is only locked while sending. While a thread waits for its
+    answer, other threads can send further commands.
     """
-    global socket_lock
-    with socket_lock:
-        socket.sendall( _CommandLength2ByteArray(message) ) # send command length
-        socket.sendall( message.encode() ) # send command
-    
-        if get_answer:
-            answer = _recv_size( socket )
-        else:
-            answer = None
-    return answer
+    request_id = post_message(socket, message, get_answer)
+    if get_answer: return receive_answer(socket, request_id)
     
 
+def post_message(socket, message, get_answer=True):
+    """
+    Sends message via socket without waiting for the answer.
+    Returns the request id of the answer (None if no answer is expected).
+    """
+    channel = _channel(socket)
+    data = message.encode()
+    with channel.send_lock:
+        if channel.error is not None: raise channel.error
+        try:
+            socket.sendall( _CommandLength2ByteArray(data) + data ) # send command length and command
+        except Exception as e:
+            channel.error = ConnectionError('Communication failed: %s' % e)
+            raise
+        if not get_answer: return None
+        request_id = channel.next_id
+        channel.next_id += 1
+        channel.pending.append(request_id)
+    return request_id
+
 
+def post_messages(socket, messages):
+    """
+    Sends several messages via socket with a single sendall() without waiting 
+    for the answers. Returns the list of request ids of the answers.
+    """
+    channel = _channel(socket)
+    data = bytearray()
+    for message in messages:
+        message = message.encode()
+        data += _CommandLength2ByteArray(message)
+        data += message
+    with channel.send_lock:
+        if channel.error is not None: raise channel.error
+        try:
+            socket.sendall(data)
+        except Exception as e:
+            channel.error = ConnectionError('Communication failed: %s' % e)
+            raise
+        request_ids = list(range(channel.next_id, channel.next_id+len(messages)))
+        channel.next_id += len(messages)
+        channel.pending.extend(request_ids)
+    return request_ids
+
+
+def receive_answer(socket, request_id):
+    """
+    Returns the answer to the message with the given request id.
+    """
+    channel = _channel(socket)
+    channel.recv_lock.acquire()
+    try:
+        while request_id not in channel.answers:
+            if channel.error is not None: raise channel.error
+            try: 
+                answer = _recv_size(socket)
+            except Exception as e:
+                channel.error = ConnectionError('Communication failed: %s' % e)
+                raise
+            channel.store_answer(answer)
+        return channel.answers.pop(request_id)
+    finally:
+        channel.release_recv_lock()
+
+    
 def run_command(JCMsolve, command, calling_pid, defaultPort=None):
     """
     Runs JCMsolve with a specific command in order to start a process
@@ -111,39 +220,40 @@ def _CommandLength2ByteArray(command):
     return bytearray( struct.pack("I", len(command)) )
 
 
+# seconds to wait for a complete answer of the daemon (None: no limit)
+recv_timeout = 300
+
+
 def _recv_size(the_socket):
     """
     Receives a message of a defined size, encoded in the first 4 bytes of the
-    message itself. Based on the recipe presented on:
-                        http://code.activestate.com/recipes/408859/
+    message itself. The message is received into a buffer preallocated from 
+    the size. Raises a ConnectionError if the message is not complete after 
+    recv_timeout seconds.
     """
-    #data length is packed into 4 bytes
-    
-    total_len = 0
-    total_data = bytearray()
-    size = sys.maxsize
-    size_data = bytearray()
-    recv_size = 4#8192
-    t0 = time.time() # measure time in this process
-    while total_len < size:
-        sock_data = the_socket.recv(recv_size)
-        if not total_data:
-            if len(sock_data) >= 4:
-                size_data.extend(sock_data)
-                size = struct.unpack('I', size_data[:4])[0]
-                recv_size = size
-                if recv_size > 524288:
-                    recv_size=524288
-                total_data.extend( size_data[4:] )
-            else:
-                size_data.extend(sock_data)
-        else:
-            total_data.extend( sock_data )
-        total_len = len(total_data) #sum([len(i) for i in total_data ])
-        t1 = time.time() - t0
-        if t1 > 300:
-            warning("""Breaking after waiting {0}s 
-            for communication.""".format(t1))
-            break
-        
-    return total_data.decode()
+    deadline = None
+    if recv_timeout is not None: deadline = time.time() + recv_timeout
+    size = struct.unpack('I', _recv_exactly(the_socket, 4, deadline))[0]
+    return _recv_exactly(the_socket, size, deadline).decode()
+
+
+def _recv_exactly(the_socket, size, deadline=None):
+    """
+    Receives exactly size bytes. Raises a ConnectionError if they are not 
+    received until the given time.
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    pos = 0
+    while pos < size:
+        if deadline is not None:
+            # measure time in this process, the socket itself stays blocking
+            remaining = max(0, deadline - time.time())
+            if len(select.select([the_socket], [], [], remaining)[0]) == 0:
+                raise ConnectionError(
+                    'No answer received after waiting {0}s for communication.'.format(
+                        recv_timeout))
+        n_recv = the_socket.recv_into(view[pos : ])
+        if n_recv == 0: raise ConnectionError('Connection closed by peer.')
+        pos += n_recv
+    return data
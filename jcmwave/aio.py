@@ -0,0 +1,331 @@
+# ==============================================================================
+#
+# Copyright(C) 2013 JCMwave GmbH, Berlin.
+# All rights reserved.
+#
+# The information and source code contained herein is the exclusive property
+# of JCMwave GmbH and may not be disclosed, examined or reproduced in whole
+# or in part without explicit written authorization from JCMwave.
+#
+# ==============================================================================
+
+__doc__ = """
+Asyncio front-end of the daemon. Jobs are submitted with :func:`solve`,
+which returns a future resolving to the results of the job. Example::
+
+    async def scan(radii):
+        jobs = [await jcmwave.aio.solve('project.jcmp', keys=dict(radius=r))
+                for r in radii]
+        async for job in jcmwave.aio.as_completed(jobs):
+            print(job.job_id, job.result())
+
+    jcmwave.daemon.startup()
+    jcmwave.daemon.add_workstation(Multiplicity=4)
+    asyncio.run(scan([1.0, 1.1, 1.2]))
+
+The status of all pending jobs of an event loop is queried by a single
+monitor task with one request, which is sent and received without blocking
+the event loop. Jobs are prepared by :func:`jcmwave.solve` and finished jobs 
+are gathered by :func:`jcmwave.daemon.wait` in the default executor of the 
+event loop.
+
+.. Warning:: Blocking daemon functions (e.g. :func:`jcmwave.daemon.wait`)
+    must not be called from a coroutine while jobs are pending in this
+    event loop. Use the coroutines of this module instead.
+"""
+
+import asyncio
+import functools
+import struct
+import time
+import weakref
+import jcmwave
+import jcmwave.__private as __private
+from jcmwave.__private.socket_communication import _channel
+from jcmwave.data_tree import data_branch as db, data_primitives as dp
+
+
+class JobFuture(asyncio.Future):
+    """
+    Future of a daemon job which resolves to the results of the job, i.e.
+    the entry of the results list returned by :func:`jcmwave.daemon.wait`.
+    The attribute ``job_id`` is the id of the job (0 if the result was
+    already available in the resultbag) and ``log`` the log of the job
+    once it is finished.
+    """
+    def __init__(self, job_id, loop=None):
+        super(JobFuture, self).__init__(loop=loop)
+        self.job_id = job_id
+        self.log = None
+
+
+class NameSpaceHelper(object):
+    pass
+
+# state of the monitor task of each event loop
+__monitors = weakref.WeakKeyDictionary()
+
+
+def __daemon_socket():
+    if not jcmwave.daemon.daemonCheck(warn=False):
+        raise EnvironmentError('No running daemon found.')
+    return __private.JCMdaemon.python_socket
+
+
+def __monitor_state(loop):
+    state = __monitors.get(loop)
+    if state is None:
+        state = NameSpaceHelper()
+        state.futures = dict() # job id -> list of JobFuture
+        state.resultbags = dict() # job id -> resultbag
+        state.lock = asyncio.Lock() # serializes the daemon communication
+        state.wake = asyncio.Event()
+        state.task = None
+        __monitors[loop] = state
+    return state
+
+
+async def send_message(socket, message, get_answer=True):
+    """
+    Coroutine version of ``send_message`` of the socket communication with
+    the same framing and request pipelining. The answer is awaited by a 
+    reader registered on the event loop instead of blocking in recv(). The 
+    receive lock shared with the blocking functions is acquired without 
+    blocking the event loop: while another thread or coroutine holds it, 
+    the coroutine waits until it is released. If the coroutine is cancelled,
+    its answer is dropped when it arrives.
+    """
+    request_id = __private.post_message(socket, message, get_answer)
+    if not get_answer: return None
+    channel = _channel(socket)
+    try: await __acquire_recv_lock(channel)
+    except asyncio.CancelledError:
+        channel.discard_answer(request_id)
+        raise
+    try:
+        while request_id not in channel.answers:
+            if channel.error is not None: raise channel.error
+            frame = NameSpaceHelper()
+            frame.received = 0
+            try:
+                size = struct.unpack('I', await __recv_exactly(socket, 4, frame))[0]
+                answer = (await __recv_exactly(socket, size, frame)).decode()
+            except asyncio.CancelledError:
+                # an answer which is not yet read is left to the next reader,
+                # a partly read answer leaves the socket out of sync
+                if frame.received > 0:
+                    channel.error = ConnectionError(
+                        'Communication cancelled while receiving an answer.')
+                else: channel.discard_answer(request_id)
+                raise
+            except BaseException as e:
+                channel.error = ConnectionError('Communication failed: %s' % e)
+                raise
+            channel.store_answer(answer)
+        return channel.answers.pop(request_id)
+    finally:
+        channel.release_recv_lock()
+
+
+async def __acquire_recv_lock(channel):
+    loop = asyncio.get_running_loop()
+    while True:
+        released = loop.create_future()
+        def wake():
+            try: loop.call_soon_threadsafe(
+                    lambda: released.done() or released.set_result(None))
+            except RuntimeError: pass # event loop closed
+        # the callback is registered before the attempt to acquire the lock,
+        # such that a release in between is not missed
+        channel.release_callbacks.add(wake)
+        try:
+            if channel.recv_lock.acquire(False): return
+            await released
+        finally:
+            channel.release_callbacks.discard(wake)
+
+
+async def __recv_exactly(socket, size, frame):
+    """
+    Receives size bytes into a preallocated buffer. Waits for the socket
+    to become readable on the event loop before each recv_into(). The
+    number of received bytes is added to frame.received.
+    """
+    loop = asyncio.get_running_loop()
+    data = bytearray(size)
+    view = memoryview(data)
+    pos = 0
+    while pos < size:
+        readable = loop.create_future()
+        try: 
+            loop.add_reader(socket.fileno(), 
+                lambda: readable.done() or readable.set_result(None))
+        except NotImplementedError: 
+            pass # event loop without reader support (proactor on Windows)
+        else:
+            try: await readable
+            finally: loop.remove_reader(socket.fileno())
+        n_recv = socket.recv_into(view[pos : ])
+        if n_recv == 0: raise ConnectionError('Connection to daemon closed.')
+        pos += n_recv
+        frame.received += n_recv
+    return data
+
+
+async def run_command(datatree, get_answer=True):
+    """
+    Coroutine version of :func:`jcmwave.daemon.run_command`.
+    """
+    socket = __daemon_socket()
+    command = jcmwave.daemon.TaskString(datatree)
+    return await send_message(socket, command, get_answer)
+
+
+async def job_info(job_ids=None, status_only=False):
+    """
+    Coroutine version of :func:`jcmwave.daemon.job_info`.
+    """
+    if job_ids is None:
+        job_ids = []
+    if isinstance(job_ids,int):
+        job_ids = [job_ids]
+    datatree = db.TreeDir.Create('JobInfo')
+    datatree.AddPrimitive("Id", dp.VectorPrimitive(job_ids,int))
+    datatree.AddPrimitive("StatusOnly",
+                                dp.NumberPrimitive(int(status_only), int))
+    daemonAnswer = await run_command(datatree)
+    return jcmwave.daemon.extractReturnValue(daemonAnswer)
+
+
+async def solve(project_file, keys=None, resultbag=None, **kwargs):
+    """
+    Submits a job to the daemon by a call of :func:`jcmwave.solve` and returns
+    a :class:`JobFuture` resolving to its results. All parameters are passed
+    to :func:`jcmwave.solve`. Example::
+
+        job = await jcmwave.aio.solve('project.jcmp', keys)
+        ... # do something else while the job is running
+        results = await job
+
+    If the job has failed, the future raises an EnvironmentError containing
+    the error log. If the results are already in the resultbag, the future
+    is resolved immediately.
+    """
+    __daemon_socket()
+    loop = asyncio.get_running_loop()
+    state = __monitor_state(loop)
+    async with state.lock:
+        job_id = await loop.run_in_executor(None, functools.partial(jcmwave.solve,
+            project_file, keys=keys, resultbag=resultbag, **kwargs))
+    if job_id == 0:
+        future = JobFuture(0, loop=loop)
+        if resultbag is not None and resultbag.check_result(keys):
+            future.log = resultbag.get_log(keys)
+            future.set_result(resultbag.get_result(keys))
+        else: future.set_result(None) # already running in another process
+        return future
+    return wait(job_id, resultbag)
+
+
+def wait(job_id, resultbag=None):
+    """
+    Returns a :class:`JobFuture` resolving to the results of a submitted job.
+    This function has to be called from within a running event loop. Example::
+
+        job_id = jcmwave.solve('project.jcmp', keys)
+        results = await jcmwave.aio.wait(job_id)
+
+    :param int job_id: job id as returned by :func:`jcmwave.solve`.
+
+    :param Resultbag resultbag: resultbag the results are added to (see
+        :func:`jcmwave.daemon.wait`).
+    """
+    if not isinstance(job_id, int) or job_id < 1:
+        raise TypeError('job_id -> positive integer expected.')
+    __daemon_socket()
+    loop = asyncio.get_running_loop()
+    state = __monitor_state(loop)
+    future = JobFuture(job_id, loop=loop)
+    state.futures.setdefault(job_id, []).append(future)
+    state.resultbags[job_id] = resultbag
+    if state.task is None or state.task.done():
+        state.task = loop.create_task(__monitor(state))
+    else: state.wake.set()
+    return future
+
+
+async def as_completed(futures, timeout=None):
+    """
+    Asynchronous iterator yielding the given futures as they are finished.
+    Example::
+
+        async for job in jcmwave.aio.as_completed(jobs):
+            print(job.job_id, job.result())
+
+    :param list futures: futures as returned by :func:`solve` or :func:`wait`.
+
+    :param float timeout: Time out in seconds. ``asyncio.TimeoutError`` is raised
+        if not all futures are finished in time (default: None).
+    """
+    pending = set(futures)
+    t0 = time.time()
+    while len(pending)>0:
+        remaining = None if timeout is None else max(0, timeout-(time.time()-t0))
+        done, pending = await asyncio.wait(pending, timeout=remaining,
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if len(done) == 0: raise asyncio.TimeoutError()
+        for future in done: yield future
+
+
+async def __monitor(state, min_interval=0.05, max_interval=1.0):
+    """
+    Queries the status of all pending jobs and resolves the futures of
+    finished jobs. Stops when no job is pending.
+    """
+    interval = min_interval
+    try:
+        while len(state.futures)>0:
+            state.wake.clear()
+            job_ids = list(state.futures.keys())
+            async with state.lock:
+                job_info_ = await job_info(job_ids, True)
+            if ('Warning' in job_info_) and job_info_['Warning']=='No resources':
+                raise Exception('No computer resources available while waiting.')
+            job_status = job_info_['Status']
+            if not isinstance(job_status, list): job_status = [job_status]
+            finished = [iD for iD, iStatus in zip(job_ids, job_status) if iStatus=='Finished']
+
+            # gather the finished jobs of each resultbag at once
+            groups = dict()
+            for iD in finished:
+                resultbag = state.resultbags.pop(iD)
+                groups.setdefault(id(resultbag), (resultbag, []))[1].append(iD)
+            for resultbag, group in groups.values():
+                async with state.lock:
+                    results, logs = await asyncio.get_running_loop().run_in_executor(
+                        None, functools.partial(jcmwave.daemon.wait, group, 
+                                                resultbag=resultbag, verbose=False))
+                for iD, result, log in zip(group, results, logs):
+                    for future in state.futures.pop(iD):
+                        if future.done(): continue # cancelled
+                        future.log = log
+                        if log is not None and log['ExitCode'] != 0:
+                            future.set_exception(EnvironmentError(
+                                'Job {0} failed with exit code {1}: {2}'.format(
+                                iD, log['ExitCode'], log['Log'])))
+                        else: future.set_result(result)
+                # give the awaiting coroutines the chance to process the results
+                await asyncio.sleep(0)
+
+            if len(finished)>0: interval = min_interval
+            else: interval = min(2*interval, max_interval)
+            if len(state.futures) == 0: break
+            try: await asyncio.wait_for(state.wake.wait(), interval)
+            except asyncio.TimeoutError: pass
+            else: interval = min_interval
+    except Exception as e:
+        for futures in state.futures.values():
+            for future in futures:
+                if not future.done(): future.set_exception(e)
+        state.futures.clear()
+        state.resultbags.clear()
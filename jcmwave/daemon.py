@@ -25,12 +25,14 @@ from jcmwave.data_tree import data_branch as db, data_primitives as dp
 import numpy as np
 import os
 import pprint
+import contextlib
 import re # regular expression parsing
 import socket # TCP communication
 import struct
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import shutil
 import string
@@ -79,15 +81,21 @@ def run_command(datatree, get_answer=True):
     else:
         return
     
+    # Daemon Interaction
+    command = TaskString(datatree) # generate string from data tree
+    return __private.send_message(socket, command, get_answer)  
+
+
+def TaskString(datatree):
+    """
+    Returns the command string of a task encoded as a data tree.
+    """
     # Generate a 'root'- and a 'Task'-data tree and add the actual data tree
     root = db.TreeDir.Create('root')
     task = db.TreeDir.Create('Task')
     task.AddTreeDir(datatree)
     root.AddTreeDir(task)
-    
-    # Daemon Interaction
-    command = WriteTreeDir(root) # generate string from data tree
-    return __private.send_message(socket, command, get_answer)  
+    return WriteTreeDir(root)
         
 
 def daemonCheck(warn=True):
@@ -121,12 +129,11 @@ def status(printOut = False):
     # Pass it to the daemon
     daemonAnswer = run_command(datatree)
     
-    # Execute the python commands which have been returned by the daemon
+    # Parse the python assignments which have been returned by the daemon
     lines = daemonAnswer.split('\n')
-    jcmNameSpaceL=locals()
-    for line in lines[1:-3]:
-        exec(line,globals(),jcmNameSpaceL)
     try:
+        jcmNameSpaceL = __private.parse_reply('\n'.join(lines[1:-3]), 
+                                              raw_strings=False)
         s1=jcmNameSpaceL['s1']
         s2=jcmNameSpaceL['s2']
     except:
@@ -562,9 +569,7 @@ def add_cluster(Nodes,
 
 
 def extractReturnValue(string):
-    string = string.replace("\\","\\\\")
-    jcmNameSpaceL=locals()
-    exec(string,globals(),jcmNameSpaceL)
+    jcmNameSpaceL = __private.parse_reply(string)
     s0 = jcmNameSpaceL['s0']
     if len(s0.keys()) == 0:
         return
@@ -845,7 +850,7 @@ def kill(job_ids = None):
         # remove the backtrace iD instance from the class
         delattr(__private.JCMdaemon, backtraceID)
         for jcm_file in backtrace.produced_jcm_files:
-            del __private.jcmt2jcm[jcm_file]
+            __private.jcmt2jcm.pop(jcm_file, None)
         if not backtrace.clean_up: continue
         shutil.rmtree(backtrace.working_dir_base, ignore_errors=True)
         try: os.rmdir(os.path.dirname(backtrace.working_dir_base))
@@ -860,7 +865,7 @@ def kill(job_ids = None):
             delattr(__private.JCMdaemon, backtraceID)
             for jcm_file in backtrace.produced_jcm_files:
                 print(jcm_file)
-                del __private.jcmt2jcm[jcm_file]
+                __private.jcmt2jcm.pop(jcm_file, None)
             if not backtrace.clean_up: continue
             shutil.rmtree(backtrace.working_dir_base, ignore_errors=True)
             try: os.rmdir(os.path.dirname(backtrace.working_dir_base))
@@ -883,13 +888,14 @@ def shutdown():
         if not iA.startswith('job_'): continue;
         backtrace = getattr(__private.JCMdaemon, iA)
         for jcm_file in backtrace.produced_jcm_files:
-            del __private.jcmt2jcm[jcm_file]
+            __private.jcmt2jcm.pop(jcm_file, None)
         if not backtrace.clean_up: continue
         shutil.rmtree(backtrace.working_dir_base, ignore_errors=True)
         try: os.rmdir(os.path.dirname(backtrace.working_dir_base))
         except: pass    
         
-
+    if getattr(__private.JCMdaemon, 'watcher', None) is not None:
+        __private.JCMdaemon.watcher.stop()
     del __private.JCMdaemon
 
 
@@ -900,6 +906,58 @@ def submit_job(project=list(),
     """
     Submits a job using a project file with a specific mode.
     """
+    datatree = __submit_tree(project, mode, resources, logFile)
+    daemonAnswer = run_command(datatree)
+    return extractReturnValue(daemonAnswer)
+
+
+def submit_jobs(jobs):
+    """
+    Submits several jobs at once and returns the list of their job ids. The
+    SubmitJob commands are pipelined: up to 32 commands are sent to the 
+    daemon before the first answer is read, such that the submission does 
+    not cost a round-trip per job. Example::
+
+        job_ids = jcmwave.daemon.submit_jobs([
+            'run_1/project.jcmp', 
+            dict(project='run_2/project.jcmp', mode='post_process')])
+
+    :param list jobs: Each entry is either a project file path (or a list of 
+        project files for a project sequence) or a dictionary with the 
+        arguments of :func:`submit_job`.
+    """
+    if daemonCheck():
+        socket = __private.JCMdaemon.python_socket
+    else:
+        return
+    if not isinstance(jobs, (list, tuple)):
+        raise TypeError('jobs -> list expected.')
+
+    commands = []
+    for job in jobs:
+        if not isinstance(job, dict): job = dict(project=job)
+        commands.append(TaskString(__submit_tree(**job)))
+
+    # the commands are sent in chunks, the answers of earlier chunks are read
+    # while sending. At most max_pending answers are unread, which fit into
+    # the socket buffers, such that the daemon is never blocked on sending 
+    # an answer while this process is blocked on sending the next commands.
+    daemonAnswers = []
+    request_ids = []
+    chunk_size = 8
+    max_pending = 32
+    for iC in range(0, len(commands), chunk_size):
+        n_read = max(0, len(request_ids)+chunk_size-max_pending)
+        daemonAnswers.extend([__private.receive_answer(socket, iR) 
+                              for iR in request_ids[0 : n_read]])
+        del request_ids[0 : n_read]
+        request_ids.extend(__private.post_messages(socket, commands[iC : iC+chunk_size]))
+    daemonAnswers.extend([__private.receive_answer(socket, iR) 
+                          for iR in request_ids])
+    return [extractReturnValue(daemonAnswer) for daemonAnswer in daemonAnswers]
+
+
+def __submit_tree(project=list(), mode='solve', resources=None, logFile=None):
     if resources is None:
         resources = []
     datatree = db.TreeDir.Create('SubmitJob')
@@ -910,15 +968,122 @@ def submit_job(project=list(),
     datatree.AddPrimitive("Resource", dp.VectorPrimitive(resources,int))
     if logFile is not None:
         datatree.AddPrimitive("LogFile", dp.StringPrimitive(True, logFile))
-    daemonAnswer = run_command(datatree)
-    return extractReturnValue(daemonAnswer)
+    return datatree
+
+
+class JobWatcher(object):
+    """
+    Watches the status of jobs on the daemon in a background thread and 
+    notifies all threads waiting for them. The status of all watched jobs 
+    is queried with a single 'JobInfo' request, independent of the number
+    of waiting threads. The thread stops as soon as no job is watched, such 
+    that an idle watcher does not communicate with the daemon.
+    """
+
+    def __init__(self, min_interval=0.05, max_interval=1.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._watched = dict() # job id -> number of watching threads
+        self._finished = set()
+        self._error = None
+        self._thread = None
+
+    def watch(self, job_ids):
+        """
+        Starts watching the given jobs.
+        """
+        with self._cond:
+            for iD in job_ids:
+                self._watched[iD] = self._watched.get(iD, 0)+1
+            self._error = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, 
+                                                name='JCMdaemonJobWatcher')
+                self._thread.daemon = True
+                self._thread.start()
+            else: self._wake.set()
+
+    def unwatch(self, job_ids):
+        """
+        Stops watching the given jobs.
+        """
+        with self._cond:
+            for iD in job_ids:
+                if iD not in self._watched: continue
+                self._watched[iD] -= 1
+                if self._watched[iD] > 0: continue
+                del self._watched[iD]
+                self._finished.discard(iD)
+
+    def wait_finished(self, job_ids, timeout=None):
+        """
+        Blocks until at least one of the watched jobs job_ids has finished 
+        or the time out (in seconds) is reached. Returns the list of 
+        finished job ids.
+        """
+        deadline = None if timeout is None else time.time()+timeout
+        with self._cond:
+            while True:
+                if self._error is not None: raise self._error
+                finished = [iD for iD in job_ids if iD in self._finished]
+                if len(finished)>0: return finished
+                remaining = None if deadline is None else deadline-time.time()
+                if remaining is not None and remaining <= 0: return []
+                self._cond.wait(remaining)
+
+    def stop(self):
+        """
+        Stops the background thread.
+        """
+        with self._cond:
+            self._watched.clear()
+            self._finished.clear()
+            self._error = EnvironmentError('Daemon was shut down while waiting.')
+            self._cond.notify_all()
+        self._wake.set()
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self._cond:
+                pending = [iD for iD in self._watched if iD not in self._finished]
+                if len(pending)==0:
+                    self._thread = None
+                    return
+            try:
+                job_info_ = job_info(pending, True)
+                job_status = job_info_['Status']
+                if ('Warning' in job_info_) and job_info_['Warning']=='No resources':
+                    raise Exception('No computer resources available while waiting.')
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._watched.clear()
+                    self._thread = None
+                    self._cond.notify_all()
+                return
+            if not isinstance(job_status, list): job_status = [job_status]
+            finished = [iD for iD, iStatus in zip(pending, job_status) if iStatus=='Finished']
+            if len(finished)>0:
+                with self._cond:
+                    self._finished.update([iD for iD in finished if iD in self._watched])
+                    self._cond.notify_all()
+                interval = self.min_interval
+            else: 
+                interval = min(2*interval, self.max_interval)
+            if self._wake.wait(interval): 
+                self._wake.clear()
+                interval = self.min_interval
 
 
 def wait(job_ids=None, 
          resultbag=None,
          verbose=True, 
          timeout=1e15, 
-         break_condition='all'):
+         break_condition='all',
+         event_driven=False):
     """
     Function that waits for the jobs with the given job_ids to finish (default:
     all jobs) and returns a list of all results and logs. Example::
@@ -946,11 +1111,20 @@ def wait(job_ids=None,
     :param str break_condition: If set to 'any' ('all') the function waits until 
         one job (all jobs) from a list of jobs has finished. (default: 'all')
 
+    :param bool event_driven: If set to True, the job status is watched by a 
+        background thread shared by all waiting threads, which wakes up this 
+        function as soon as a job has finished. Finished jobs are gathered 
+        immediately instead of after the next back-off interval of up to 2 s. 
+        (default: False)
+
     :returns: A tuple (results, logs) 
 
         :results: List containing the computed results for each job
             as referenced by the job_ids vector.
         :logs: List containing the corresponding log messages of the jobs.  
+            The entry 'ChangedFiles' of a log lists the .jcm input files 
+            which were rewritten for the job by :func:`jcmwave.solve` 
+            (files with unchanged content are not touched).
     
         If a resultbag is passed the output is stored in the resultbag and
         is not returned.    
@@ -970,6 +1144,8 @@ def wait(job_ids=None,
     if not isinstance(break_condition, str) and (
                 not break_condition in ['all', 'any', 'cache']):
         raise TypeError('break_condition -> "all" or "any" expected.') # cache is only used internally
+    if not isinstance(event_driven, bool):
+        raise TypeError('event_driven -> boolean expected.')
     
     # Get a list of all running jobs from the daemon, if no explicit list of
     # job_ids was given
@@ -995,25 +1171,60 @@ def wait(job_ids=None,
     if not timeout == 1e15:
       min_wait_interval = timeout / 100
       max_wait_interval = timeout / 10
-    wait_interval = min_wait_interval
     
     # Initializations
-    t0 = time.time()
-
     running_job_ids = set.difference(job_ids, __private.JCMdaemon.cachedIDs)
     if (break_condition == 'any') and (len(running_job_ids)<len(job_ids)):
         running_job_ids.clear()
+
+    watcher = None
+    if event_driven and break_condition != 'cache' and len(running_job_ids)>0:
+        if getattr(__private.JCMdaemon, 'watcher', None) is None:
+            __private.JCMdaemon.watcher = JobWatcher()
+        watcher = __private.JCMdaemon.watcher
+        watched_job_ids = list(running_job_ids)
+        watcher.watch(watched_job_ids)
+    try:
+        return __wait(job_ids, running_job_ids, job_id_to_return_index, 
+                      watcher, resultbag, verbose, timeout, break_condition, 
+                      min_wait_interval, max_wait_interval)
+    finally:
+        if watcher is not None: watcher.unwatch(watched_job_ids)
+
+
+@contextlib.contextmanager
+def __resultbag_batch(resultbag):
+    """
+    Groups the writes to the resultbag (if any) into one transaction.
+    """
+    if resultbag is None: yield
+    else:
+        with resultbag.batch(): yield
+
+
+def __wait(job_ids, running_job_ids, job_id_to_return_index, watcher, 
+           resultbag, verbose, timeout, break_condition, 
+           min_wait_interval, max_wait_interval):
+    """
+    Waits for the running jobs and gathers their results (see wait()).
+    """
+    wait_interval = min_wait_interval
+    t0 = time.time()
     
     # Loop that runs till all jobs are finished and adjusts the wait time in
     # each loop
     while (len(running_job_ids)>0):
-        job_info_= job_info(list(running_job_ids), True)
-        job_status = job_info_['Status']
-        if (break_condition != 'cache') and (('Warning' in job_info_) and job_info_['Warning']=='No resources'):
-            raise Exception('No computer resources available while waiting.')
-            return
-        if not isinstance(job_status, list): job_status=[job_status] 
-        finished_job_ids = [iD for iD, iStatus in zip(running_job_ids, job_status) if iStatus=='Finished']
+        if watcher is not None:
+            finished_job_ids = watcher.wait_finished(list(running_job_ids), 
+                None if timeout == 1e15 else max(0, timeout-(time.time()-t0)))
+        else:
+            job_info_= job_info(list(running_job_ids), True)
+            job_status = job_info_['Status']
+            if (break_condition != 'cache') and (('Warning' in job_info_) and job_info_['Warning']=='No resources'):
+                raise Exception('No computer resources available while waiting.')
+                return
+            if not isinstance(job_status, list): job_status=[job_status] 
+            finished_job_ids = [iD for iD, iStatus in zip(running_job_ids, job_status) if iStatus=='Finished']
         if (break_condition == 'any') and (len(finished_job_ids)>0):
             finished_job_ids = [finished_job_ids[0]]
         parse_time = 0.0;
@@ -1027,57 +1238,64 @@ def wait(job_ids=None,
             logs=[None]*len(finished_job_ids)
             infos=[None]*len(finished_job_ids)
             keys=[None]*len(finished_job_ids)
-            for iF, iD in enumerate(finished_job_ids):
-                backtraceID = 'job_{0}'.format(iD)
-                try: backtrace = getattr(__private.JCMdaemon, backtraceID)
-                except AttributeError: 
-                    running_job_ids.remove(iD)
-                    continue                
-                if not isinstance(job_infos, list): job_infos = [job_infos]
-                j_info = job_infos[iF]
-                if (j_info['ExitCode'] == 0):
-                    if j_info['Log']['Out'] == 'Project is up-to-date.':
-                        stat = 'Up-to-date'
-                    else: stat = 'Finished'
-                else: stat = 'Failed'
-
-                thisInfo='{0}: {1}'.format(stat, ', '.join(backtrace.files))
-                if verbose:
-                    print(thisInfo)
-                    thisInfo=''
+            released_job_ids=[]
+            with __resultbag_batch(resultbag):
+                try:
+                    for iF, iD in enumerate(finished_job_ids):
+                        backtraceID = 'job_{0}'.format(iD)
+                        try: backtrace = getattr(__private.JCMdaemon, backtraceID)
+                        except AttributeError: 
+                            running_job_ids.remove(iD)
+                            continue                
+                        if not isinstance(job_infos, list): job_infos = [job_infos]
+                        j_info = job_infos[iF]
+                        if (j_info['ExitCode'] == 0):
+                            if j_info['Log']['Out'] == 'Project is up-to-date.':
+                                stat = 'Up-to-date'
+                            else: stat = 'Finished'
+                        else: stat = 'Failed'
+
+                        thisInfo='{0}: {1}'.format(stat, ', '.join(backtrace.files))
+                        if verbose:
+                            print(thisInfo)
+                            thisInfo=''
         
-                thisLog = {}
-                thisLog['ExitCode'] = j_info['ExitCode']
-                thisLog['Log'] = j_info['Log']
-
-                if thisLog['ExitCode'] == 0:
-                    thisResults=list()
-                    for i_project in range(0, len(backtrace.files)):
-                        thisResults.append(gather_results(
-                            backtrace.files[i_project], backtrace.eigdate_old[i_project], backtrace.mode, 
-                            backtrace.table_format, backtrace.cartesianfields_format))
-                    if not backtrace.isProjectSequence: thisResults=thisResults[0]
-                else:
-                    thisResults = []
-
-                key=None;
-                if (resultbag is not None): 
-                  resultbag.add(id = iD, result = thisResults, log = thisLog)
-                  key=resultbag.get_keys_by_job_id(iD)
-                  resultbag.release(iD)
+                        thisLog = {}
+                        thisLog['ExitCode'] = j_info['ExitCode']
+                        thisLog['Log'] = j_info['Log']
+                        thisLog['ChangedFiles'] = getattr(backtrace, 'changed_jcm_files', [])
+
+                        if thisLog['ExitCode'] == 0:
+                            thisResults=list()
+                            for i_project in range(0, len(backtrace.files)):
+                                thisResults.append(gather_results(
+                                    backtrace.files[i_project], backtrace.eigdate_old[i_project], backtrace.mode, 
+                                    backtrace.table_format, backtrace.cartesianfields_format))
+                            if not backtrace.isProjectSequence: thisResults=thisResults[0]
+                        else:
+                            thisResults = []
+
+                        key=None;
+                        if (resultbag is not None): 
+                          resultbag.add(id = iD, result = thisResults, log = thisLog)
+                          key=resultbag.get_keys_by_job_id(iD)
+                          released_job_ids.append(iD)
                   
-                  thisResults=None
-                  thisLog=None
+                          thisResults=None
+                          thisLog=None
                   
-                results[iF]=thisResults
-                logs[iF]=thisLog
-                infos[iF]=thisInfo
-                keys[iF]=key
+                        results[iF]=thisResults
+                        logs[iF]=thisLog
+                        infos[iF]=thisInfo
+                        keys[iF]=key
                 
-                del thisResults
-                del thisLog
-                running_job_ids.remove(iD)
-                __private.JCMdaemon.cachedIDs[iD]=[results[iF], logs[iF], infos[iF], keys[iF]]
+                        del thisResults
+                        del thisLog
+                        running_job_ids.remove(iD)
+                        __private.JCMdaemon.cachedIDs[iD]=[results[iF], logs[iF], infos[iF], keys[iF]]
+                finally:
+                    # release the jobs of all gathered results at once
+                    if len(released_job_ids)>0: resultbag.release(released_job_ids)
 
             del results
             del logs
@@ -1093,8 +1311,9 @@ def wait(job_ids=None,
                 # remove the backtrace iD instance from the class
                 delattr(__private.JCMdaemon, backtraceID)
 
+                # jobs sharing a working directory share the backtraces of their files
                 for jcm_file in backtrace.produced_jcm_files:
-                    del __private.jcmt2jcm[jcm_file]
+                    __private.jcmt2jcm.pop(jcm_file, None)
         
                 if backtrace.clean_up:
                     shutil.rmtree(backtrace.working_dir_base)
@@ -1111,6 +1330,8 @@ def wait(job_ids=None,
         if (time.time() - t0) >= timeout:
             return None, None, None
             break 
+        if len(running_job_ids)==0: break
+        if watcher is not None: continue
         
         # adjust wait time interval
         if (len(finished_job_ids)==0):
@@ -1138,31 +1359,34 @@ def wait(job_ids=None,
     daemonAnswer = run_command(datatree)
     
     finished_ids = []
-    for iD in job_ids:
-        return_index = job_id_to_return_index[iD]
-        finished_ids.append(return_index)
-        thisResults = __private.JCMdaemon.cachedIDs[iD][0]
-        thisLog = __private.JCMdaemon.cachedIDs[iD][1]
-        thisInfo =  __private.JCMdaemon.cachedIDs[iD][2]
-        thisKey =  __private.JCMdaemon.cachedIDs[iD][3]
-        del __private.JCMdaemon.cachedIDs[iD]
-
-        if verbose and len(thisInfo)>0:
-            print(thisInfo);
+    released_job_ids = []
+    with __resultbag_batch(resultbag):
+        for iD in job_ids:
+            return_index = job_id_to_return_index[iD]
+            finished_ids.append(return_index)
+            thisResults = __private.JCMdaemon.cachedIDs[iD][0]
+            thisLog = __private.JCMdaemon.cachedIDs[iD][1]
+            thisInfo =  __private.JCMdaemon.cachedIDs[iD][2]
+            thisKey =  __private.JCMdaemon.cachedIDs[iD][3]
+            del __private.JCMdaemon.cachedIDs[iD]
+
+            if verbose and len(thisInfo)>0:
+                print(thisInfo);
         
-        if (resultbag is not None):
-            if (thisResults is not None): 
-                resultbag.add(id = iD, result = thisResults, log = thisLog)
-                resultbag.release(iD)
-            elif thisKey is not None:
-                try :
-                    thisResults=resultbag.get_result(thisKey)
-                except: 
-                    thisResults=[]
-                thisLog=resultbag.get_log(thisKey)
+            if (resultbag is not None):
+                if (thisResults is not None): 
+                    resultbag.add(id = iD, result = thisResults, log = thisLog)
+                    released_job_ids.append(iD)
+                elif thisKey is not None:
+                    try :
+                        thisResults=resultbag.get_result(thisKey)
+                    except: 
+                        thisResults=[]
+                    thisLog=resultbag.get_log(thisKey)
                     
-        results[return_index] = thisResults 
-        logs[return_index] = thisLog
+            results[return_index] = thisResults 
+            logs[return_index] = thisLog
+        if len(released_job_ids)>0: resultbag.release(released_job_ids)
     
     if break_condition == 'any':
         return finished_ids, results, logs
@@ -12,7 +12,6 @@
 import os
 import sys
 import re
-import shutil
 import warnings
 import jcmwave
 import jcmwave.__private as __private
@@ -26,7 +25,9 @@ def geo(project_dir=None,
         process_keys=None,
         working_dir=None,
         jcmt_pattern=None,
-        show=None):
+        show=None,
+        grid_cache=None,
+        grid_cache_size=None):
     """
     Starts JCMgeo for mesh generation. 
     
@@ -51,6 +52,22 @@ def geo(project_dir=None,
     :param str jcmt_pattern: pattern for selection of .jcmt files. 
 
         layout.<pattern>.jcmt is used instead of sources.jcmt when present. 
+
+    :param grid_cache: directory path of a persistent cache of generated grids,
+        or True for the default directory ``~/.jcmwave/grid_cache`` (default: None). 
+
+        The grids are cached by the content of the layout.jcm, triangulator.jcm 
+        and .gds files in the working directory and by the JCMgeo version. 
+        If a grid for the same input is found, it is hard-linked (or copied) 
+        into the working directory and JCMgeo is not called (except when 
+        the mesh is shown). Example::
+
+            for wvl in wavelengths:
+                jcmwave.geo('.', keys, working_dir='wvl_%g' % wvl, grid_cache=True)
+
+    :param int grid_cache_size: maximum total size of the grid cache in bytes 
+        (default: 2 GB). The least recently used grids are removed when the 
+        size is exceeded.
     """
 
     if __private.JCMsolve is None: jcmwave.startup();
@@ -78,6 +95,13 @@ def geo(project_dir=None,
         raise TypeError('jcmt_pattern -> string expected.');
     if show is not None and not isinstance(show, (int,long,float)):
         raise TypeError('show -> float or integer value expected.');      
+    if grid_cache is True: grid_cache = __private.gridcache.DEFAULT_DIR
+    elif grid_cache is False: grid_cache = None
+    if grid_cache is not None and not isinstance(grid_cache, str):
+        raise TypeError('grid_cache -> directory path or boolean expected.');      
+    if grid_cache_size is None: grid_cache_size = __private.gridcache.DEFAULT_MAX_BYTES
+    if not isinstance(grid_cache_size, int) or grid_cache_size<0:
+        raise TypeError('grid_cache_size -> non-negative integer expected.');      
         
 
     # run embedded script when required
@@ -101,12 +125,27 @@ def geo(project_dir=None,
                         jcm_file = jcm_pattern_file;
                 except: pass
                 if jcm_file_pd!=jcm_file_wd and os.path.isfile(jcm_file_pd):
-                   try: shutil.copyfile(jcm_file_pd, jcm_file_wd);
+                   try: __private.copy_if_changed(jcm_file_pd, jcm_file_wd);
                    except: EnvironmentError('Can`t copy file "%s" to working directory.')
                 continue
             try: jcmwave.jcmt2jcm(jcmt_file, keys, outputfile=jcm_file_wd); 
             except Exception as ex: raise ex
 
+    # reuse a cached grid of the same layout. A cached grid was created and 
+    # checked by JCMgeo before it was stored, hence the checks of the output 
+    # of JCMgeo below are skipped on a hit.
+    grid_file = os.path.join(working_dir, 'grid.jcm')
+    grid_tag = None
+    if grid_cache is not None:
+        grid_tag = __private.gridtag(working_dir)
+        if (show is None and grid_tag is not None and 
+            __private.fetchgrid(grid_cache, grid_tag, grid_file)): return
+
+    # JCMgeo must not overwrite a cached grid linked into the working directory
+    try: 
+        if os.stat(grid_file).st_nlink > 1: os.remove(grid_file)
+    except OSError: pass
+
     show_str = '';
     if show is not None:
         if (show==float('inf')): show_str = ' --show'
@@ -135,5 +174,8 @@ def geo(project_dir=None,
     if not os.path.isfile(os.path.join(project_dir, 'grid.jcm')):
         raise RuntimeError('*** JCMgeo failed.')
 
+    if grid_tag is not None: 
+        __private.storegrid(grid_cache, grid_tag, grid_file, grid_cache_size)
+
 
     
@@ -79,6 +79,10 @@ def jcmt2jcm(jcmt_file, keys, outputfile=None):
       RelPermittvity = 2.25
       RelPermeability = 1.0
     }
+
+    If the output file already exists with the same content, it is not 
+    rewritten and keeps its modification time. Hence, e.g. an unchanged 
+    layout.jcm does not cause a regeneration of the mesh. 
     """
 
     try: 
@@ -128,9 +132,8 @@ def __jcmt2jcm(jcmt_file, keys, outputfile):
     [jcm,backtrace]=__private.jcmt2jcm_from_string(jcmt, keys, jcmt_file)
     backtrace['jcm'] = os.path.abspath(jcm_file)
     
-    # create final .jcm file
-    try:
-        with open(jcm_file, 'w') as f: f.write(jcm)
+    # create final .jcm file (an existing file with the same content is not touched)
+    try: backtrace['changed'] = __private.write_if_changed(jcm_file, jcm)
     except: raise EnvironmentError('Can`t create .jcm file "%s".' % (jcm_file,))
 
     jcmfile_tag=hashlib.md5(backtrace['jcm'].encode()).hexdigest()
@@ -0,0 +1,107 @@
+# Copyright(C) 2012 JCMwave GmbH, Berlin.
+#  All rights reserved.
+#
+# The information and source code contained herein is the exclusive property
+# of JCMwave GmbH and may not be disclosed, examined or reproduced in whole
+# or in part without explicit written authorization from JCMwave.
+#
+
+
+import jcmwave
+import jcmwave.__private as __private
+
+def load_many(paths, kind='table', workers=None, **kwargs):
+    """
+    Loads a list of result files of the same type in parallel and stacks
+    their data along a leading run axis.
+
+    :param list paths: paths to .jcm result files, e.g. the flux tables or
+        Cartesian fieldbags of a wavelength sweep. All files must have
+        the same structure (same columns, same number of fields and same
+        grid size).
+
+    :param str kind: 'table' (default) to load the files with
+        :func:`jcmwave.loadtable` or 'cartesian' to load them with
+        :func:`jcmwave.loadcartesianfields`.
+
+    :param int workers: number of threads used for loading (default:
+        number of CPU cores, at most the number of files). File reads and
+        numpy conversions release the GIL, so the files are read concurrently.
+
+    Further keyword arguments (e.g. ``format``, ``region``, ``components``)
+    are passed to the loader.
+
+    :returns: The data structure returned by the loader for a single file,
+        where each numpy array is replaced by the stacked array of all runs.
+        The entry ``A[iRun, ...]`` of a stacked array ``A`` refers to
+        ``paths[iRun]``. The entries 'title' and 'header' are taken from
+        the first file (shared header).
+
+    Example::
+
+        Plot the flux through the first interface as function of the
+        wavelength:
+
+        >>> paths = ['wvl_%d/project_results/flux.jcm' % wvl for wvl in wvls]
+        >>> flux = jcmwave.load_many(paths, workers=4)
+        >>> plot(wvls, flux['ElectricFlux'][0][:, 0].real)
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    if __private.JCMsolve is None: jcmwave.startup();
+
+    if not isinstance(paths, (list, tuple)) or len(paths)==0 or (
+        not all(isinstance(path, str) for path in paths)):
+        raise TypeError('paths -> list of file paths expected.')
+
+    if kind == 'table': loader = jcmwave.loadtable
+    elif kind == 'cartesian': loader = jcmwave.loadcartesianfields
+    else: raise TypeError("kind -> 'table' or 'cartesian' expected.")
+
+    if workers is None: workers = __private.__system['n_cores']
+    if not isinstance(workers, int) or workers<1:
+        raise TypeError('workers -> positive integer expected.')
+    workers = min(workers, len(paths))
+
+    if workers == 1:
+        runs = [loader(path, **kwargs) for path in paths]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            runs = list(pool.map(lambda path: loader(path, **kwargs), paths))
+
+    return __stack(runs, paths)
+
+
+def __stack(runs, paths, key=None):
+    """
+    Stacks the entries of the loaded runs recursively.
+    """
+    import numpy as np
+    first = runs[0]
+    if key in ('title', 'header'): return first
+
+    if isinstance(first, dict):
+        for iRun, run in enumerate(runs):
+            if not isinstance(run, dict) or run.keys() != first.keys():
+                raise ValueError('Entries of %s differ from %s.' % (paths[iRun], paths[0]))
+        return dict([(k, __stack([run[k] for run in runs], paths, k)) for k in first])
+
+    if isinstance(first, list):
+        for iRun, run in enumerate(runs):
+            if not isinstance(run, list) or len(run) != len(first):
+                raise ValueError('Entries of %s differ from %s.' % (paths[iRun], paths[0]))
+        # format 'list' of loadtable: [title, header, data1, ...]
+        named = len(first)>1 and isinstance(first[0], str)
+        keys = ['title', 'header'] if named else []
+        keys += [None]*(len(first)-len(keys))
+        return [__stack([run[ii] for run in runs], paths, keys[ii])
+                for ii in range(len(first))]
+
+    if isinstance(first, str): return first
+
+    for iRun, run in enumerate(runs):
+        if np.shape(run) != np.shape(first):
+            raise ValueError('Shape of %s%s differs from %s.' % (
+                '' if key is None else repr(key) + ' in ',
+                paths[iRun], paths[0]))
+    return np.stack([np.asarray(run) for run in runs])
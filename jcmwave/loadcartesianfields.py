@@ -15,7 +15,11 @@ import jcmwave
 from jcmwave import nested_dict
 import jcmwave.__private as __private
 
-def loadcartesianfields(file_name, format='squeeze'):
+class NameSpaceHelper(object):
+    pass
+
+def loadcartesianfields(file_name, format='squeeze', mmap=False, lazy_grid=False, 
+                        region=None, components=None, fields=None, cache=False):
     """
     Loads a tensor fields given on a Cartesian grid stored in .jcm format.
    
@@ -24,6 +28,37 @@ def loadcartesianfields(file_name, format='squeeze'):
     :param str format: format of the table after load. 
 
         Allowed values are: 'squeeze' (default) and 'full'. For details the "Results". 
+
+    :param bool mmap: If set to ``True``, the file is not read into memory. 
+        Instead, the grid points, the domain ids and the fields are returned 
+        as read-only ``numpy.memmap`` views into the file (default: False). 
+        Fields of partial polarization (e.g. 'xy') are expanded to the 
+        full tensor and are therefore loaded into memory. 
+
+    :param bool lazy_grid: If set to ``True``, the coordinate arrays ``X``, ``Y``, ``Z`` 
+        are read-only broadcast views of the 1D sampling vectors, which are 
+        additionally returned as ``['grid']['points']`` (default: False). 
+        Call ``numpy.array(X)`` to materialize a full coordinate grid. 
+
+    :param dict region: Restricts the load to a subgrid (default: None). The keys 
+        'x', 'y', 'z' (first, second and third grid direction) map to a slice 
+        or an integer index of the sampling points in that direction, e.g. 
+        ``region=dict(x=10, y=slice(0, 100))``. Only the bytes needed for the 
+        selected points are read. Domain ids are not loaded for a region.
+
+    :param list components: indices of the field components to be returned 
+        (default: all components).
+
+    :param list fields: indices of the fields of the fieldbag to be returned 
+        (default: all fields).
+
+    :param cache: If set to ``True``, the loaded fieldbag is stored in the directory 
+        ``<file_name>.cache`` as .npy files and reloaded from there as long as size 
+        and modification time of the fieldbag file and the load options are 
+        unchanged. With ``mmap=True`` the cached arrays are reopened as 
+        read-only ``numpy.memmap``. With ``cache='compressed'`` a compressed 
+        archive ``<file_name>.npz`` is used instead, which is not memory-mapped
+        (default: False).
         
    
     :returns: Dictionary with the following entries:
@@ -55,7 +90,56 @@ def loadcartesianfields(file_name, format='squeeze'):
    
     """
 
-    import numpy as np
+    if not (cache is True or cache is False or cache == 'compressed'):
+        raise TypeError("cache -> boolean or 'compressed' expected.")
+
+    if cache:
+        if __private.JCMsolve is None: jcmwave.startup();
+        options = dict(loader='loadcartesianfields', format=format, 
+                       lazy_grid=lazy_grid, region=region, 
+                       components=components, fields=fields)
+        compressed = cache == 'compressed'
+        fieldbag = __private.loadcache(file_name, options, compressed, mmap)
+        if fieldbag is not None: return fieldbag
+
+    fieldbag = dict()
+    fieldbag['field'] = list()
+    for iF, field in iter_cartesianfields(file_name, format, fieldbag, mmap, 
+        lazy_grid, region, components, fields):
+        fieldbag['field'].append(field)
+
+    if cache: __private.savecache(file_name, options, fieldbag, compressed)
+    return fieldbag
+
+
+def iter_cartesianfields(file_name, format='squeeze', fieldbag=None, mmap=False, 
+                         lazy_grid=False, region=None, components=None, fields=None):
+    """
+    Iterates over the fields of a Cartesian fieldbag stored in .jcm format. 
+    The grid is parsed once, the fields are read one by one, such that only
+    a single field is held in memory at a time. Example::
+
+        grid = dict()
+        intensity = 0.0
+        for iF, field in jcmwave.iter_cartesianfields('./project_results/cartesian_xy.jcm', fieldbag=grid):
+            intensity += np.sum(np.abs(field)**2, axis=-1)
+        pcolormesh(grid['X'], grid['Y'], intensity, shading='gouraud') 
+
+    :param filepath file_name: path to a Cartesian fieldbag in .jcm format. 
+
+    :param dict fieldbag: dictionary which is filled with the entries 'X', 'Y', 'Z', 
+        'header' and 'grid' as returned by :func:`jcmwave.loadcartesianfields` 
+        (optional). 
+
+    The parameters format, mmap, lazy_grid, region, components and fields are
+    the same as for :func:`jcmwave.loadcartesianfields`. 
+
+    :returns: generator yielding tuples ``(index, field)``, where ``index`` is the 
+        index of the field in the fieldbag and ``field`` has the shape of an
+        entry of ``loadcartesianfields(file_name)['field']``. The file is opened 
+        and the grid entries of fieldbag are filled when the iteration starts.
+    """
+
     if __private.JCMsolve is None: jcmwave.startup();
 
     
@@ -66,94 +150,142 @@ def loadcartesianfields(file_name, format='squeeze'):
     if not isinstance(format, str) or not (format in ['squeeze', 
         'full']):
         raise TypeError('Invalid format');
-    with open(file_name, 'rb') as ffb:
-        try: header=__private.readblobheader(ffb, 'CartesianFieldBag')
-        except TypeError as tEx: raise tEx
-        except Exception as ex: raise Exception('Corrupted file.')
-
-        nFields = header['NFields']
-        numbertype = 'complex128';
-        nSubs = 0;
-        while True:
-            try:
-                header['TensorQuantityVector'][nSubs]
-                nSubs+=1;
-            except: break
-        
-        nComponents = list();
-        for iSubField in range(0, nSubs):  
-            nComponents.append(header['TensorQuantityVector'][
-                iSubField]['NComponents']) 
 
-        spaceDim = header['Grid']['SpaceDim'];
-        lattice = header['Grid']['NPoints'];
+    if fieldbag is None: fieldbag = dict()
+    elif not isinstance(fieldbag, dict):
+        raise TypeError('fieldbag -> dictionary expected.')
 
-        for iX in range(spaceDim, 3): np.append(lattice, 1)
-    
-    
-        nP = lattice.prod();
-        nCells = np.matrix([max(iX[0]-1, 1) for iX in lattice]).prod()
+    if not isinstance(mmap, bool):
+        raise TypeError('mmap -> boolean expected.')
 
-        if not header['__MODE__'] == 'BINARY':
-            raise  RuntimeError('file not in binary format')
+    if not isinstance(lazy_grid, bool):
+        raise TypeError('lazy_grid -> boolean expected.')
 
-        fieldbag = dict();
-        
-        points = [np.arange(0, 0.1, 0.1), np.arange(0, 0.1, 0.1), np.arange(0, 0.1, 0.1)]
-        fieldbag['field'] = list()
-        fieldlist = fieldbag['field']
+    if region is not None and (not isinstance(region, dict) or 
+        not set(region.keys()) <= set(['x', 'y', 'z'])):
+        raise TypeError("region -> dictionary with keys 'x', 'y', 'z' expected.")
+
+    if components is not None and (not isinstance(components, (list, tuple)) or 
+        len(components)==0 or not all(isinstance(iC, int) for iC in components)):
+        raise TypeError('components -> list of integers expected.')
+
+    if fields is not None and (not isinstance(fields, (list, tuple)) or 
+        len(fields)==0 or not all(isinstance(iF, int) for iF in fields)):
+        raise TypeError('fields -> list of integers expected.')
+
+    return __iterfields(file_name, format, fieldbag, mmap, lazy_grid, 
+                        region, components, fields)
+
+
+def __readgrid(ffb, file_name, format, fieldbag, mmap, lazy_grid, 
+               region, components, fields):
+    """
+    Parses the header and the grid of a Cartesian fieldbag. The grid entries 
+    are set in fieldbag, the returned namespace holds all information needed 
+    to read the fields.
+    """
+
+    import numpy as np
+
+    try: header=__private.readblobheader(ffb, 'CartesianFieldBag')
+    except TypeError as tEx: raise tEx
+    except Exception as ex: raise Exception('Corrupted file.')
+
+    nFields = header['NFields']
+    numbertype = 'complex128';
+    nSubs = 0;
+    while True:
         try:
-            for iX in range(0, spaceDim):
-                points[iX] = np.fromfile(ffb, 'float64', lattice[iX][0]);
-            
-            try:
-                containsDomainIds = nested_dict.get(header, 'Grid.ContainsDomainIds')=='yes';
-            except: containsDomainIds = False;
-            try:
-                containsDomainIds = nested_dict.get(header, 'Grid.ContainsMaterialIds')=='yes';
-            except: pass
-            if containsDomainIds:
-                nested_dict.set(fieldbag, 'grid.domainIds', np.fromfile(ffb, 'int32', nCells))
+            header['TensorQuantityVector'][nSubs]
+            nSubs+=1;
+        except: break
+    
+    nComponents = list();
+    for iSubField in range(0, nSubs):  
+        nComponents.append(header['TensorQuantityVector'][
+            iSubField]['NComponents']) 
+
+    spaceDim = header['Grid']['SpaceDim'];
+    lattice = header['Grid']['NPoints'];
+
+    for iX in range(spaceDim, 3): np.append(lattice, 1)
+
 
-            nComp = nComponents[0]
-            for iF in range(0, nFields):
-                values = np.fromfile(ffb, numbertype, nComp*nP);
-                values.shape = (nP, nComp)
-                fieldlist.append(values)
-        except: raise RuntimeError('Corrupted file')
+    nP = int(lattice.prod());
+    nCells = int(np.matrix([max(iX[0]-1, 1) for iX in lattice]).prod())
 
+    if not header['__MODE__'] == 'BINARY':
+        raise  RuntimeError('file not in binary format')
+
+    lattice = lattice.reshape(3,).astype('int64')
+    if region is not None: region = __regionslices(region, lattice)
+    if fields is None: fields = range(0, nFields)
+    elif max(fields) >= nFields or min(fields) < -nFields:
+        raise TypeError('fields -> field index out of range.')
 
     pol = nested_dict.get(header, ['TensorQuantityVector', 0, 'Polarization'])
     ttype = nested_dict.get(header, ['TensorQuantityVector', 0, 'Type'])
+    nComp = nComponents[0]
 
     # return full tensor in any case
+    indices = None
     if pol!='xyz' and ttype.find('Strength')!=-1:
         indices = list()
         for iX in range(0, 3):
            if pol.count('xyz'[iX]): indices.append(iX)
-        for  iF in range(0, nFields):
-            pol_data = fieldlist[iF]
-            fieldlist[iF] = np.ndarray([pol_data.shape[0], 3], dtype=numbertype)
-            fieldlist[iF].fill(0.0)
-            fieldlist[iF][:, indices] = pol_data
-        nComp=3
-
-    lattice = lattice.reshape(3,)
-    X = np.ndarray(lattice);
-    Y = np.ndarray(lattice);
-    Z = np.ndarray(lattice);
-
-    for iY in range(0, lattice[1]):
-        for iZ in range(0, lattice[2]):
-             X[:, iY, iZ] = points[0]
-
-    for iX in range(0, lattice[0]):
-        for iZ in range(0, lattice[2]):
-             Y[iX, :, iZ] = points[1]
-
-    for iX in range(0, lattice[0]):
-        for iY in range(0, lattice[1]):
-             Z[iX, iY, :] = points[2]
+        nCompOut = 3
+    else: nCompOut = nComp
+
+    if components is not None:
+        if max(components) >= nCompOut or min(components) < -nCompOut:
+            raise TypeError('components -> component index out of range.')
+        nCompOut = len(components)
+
+    points = [np.arange(0, 0.1, 0.1), np.arange(0, 0.1, 0.1), np.arange(0, 0.1, 0.1)]
+    data = None
+    try:
+        try:
+            containsDomainIds = nested_dict.get(header, 'Grid.ContainsDomainIds')=='yes';
+        except: containsDomainIds = False;
+        try:
+            containsDomainIds = nested_dict.get(header, 'Grid.ContainsMaterialIds')=='yes';
+        except: pass
+
+        # byte offsets of the data blocks
+        offset = ffb.tell()
+        offsetPoints = list()
+        for iX in range(0, spaceDim):
+            offsetPoints.append(offset)
+            offset += 8*int(lattice[iX])
+        offsetDomainIds = offset
+        if containsDomainIds: offset += 4*nCells
+        fieldSize = np.dtype(numbertype).itemsize*nComp*nP
+        offsetFields = [offset+iF*fieldSize for iF in range(0, nFields)]
+
+        if mmap: data = np.memmap(file_name, 'uint8', mode='r')
+
+        for iX in range(0, spaceDim):
+            points[iX] = __readblock(ffb, data, offsetPoints[iX], 'float64', int(lattice[iX]))
+        if containsDomainIds and region is None:
+            nested_dict.set(fieldbag, 'grid.domainIds', 
+                __readblock(ffb, data, offsetDomainIds, 'int32', nCells))
+    except: raise RuntimeError('Corrupted file')
+
+    gridLattice = lattice.copy()
+    if region is not None:
+        for iX in range(0, 3):
+            points[iX] = points[iX][region[iX]]
+            gridLattice[iX] = points[iX].shape[0]
+
+    X = np.broadcast_to(points[0].reshape(-1, 1, 1), gridLattice)
+    Y = np.broadcast_to(points[1].reshape(1, -1, 1), gridLattice)
+    Z = np.broadcast_to(points[2].reshape(1, 1, -1), gridLattice)
+    if lazy_grid:
+        nested_dict.set(fieldbag, 'grid.points', points)
+    else:
+        X = X.copy()
+        Y = Y.copy()
+        Z = Z.copy()
         
     if format=='squeeze':  
         X=np.squeeze(X)
@@ -169,10 +301,6 @@ def loadcartesianfields(file_name, format='squeeze'):
         fieldbag['Y'] = Y
         fieldbag['Z'] = Z
  
-    shape = list(X.shape); shape.append(nComp);
-    for iF in range(0, nFields):
-        fieldlist[iF] = fieldlist[iF].reshape(shape, order='F')
-
     try:
         fieldbag['header'] = {'Origin' : header['Grid']['Origin'], 'Rotation':np.eye(3), 'QuantityType': ttype }            
         for iD,dir_ in enumerate(['X','Y','Z']):    
@@ -180,5 +308,125 @@ def loadcartesianfields(file_name, format='squeeze'):
 
     except:
         pass
-    return fieldbag
 
+    bag = NameSpaceHelper()
+    bag.data = data
+    bag.numbertype = numbertype
+    bag.lattice = lattice
+    bag.region = region
+    bag.fields = fields
+    bag.offsetFields = offsetFields
+    bag.nComp = nComp
+    bag.indices = indices
+    bag.components = components
+    bag.shape = list(X.shape)+[nCompOut]
+    return bag
+
+
+def __iterfields(file_name, format, fieldbag, mmap, lazy_grid, 
+                 region, components, fields):
+    """
+    Generator reading the fields of a Cartesian fieldbag one by one. The file 
+    is opened on the first call of next() and closed when the generator is 
+    exhausted or closed.
+    """
+
+    import numpy as np
+
+    with open(file_name, 'rb') as ffb:
+        bag = __readgrid(ffb, file_name, format, fieldbag, mmap, lazy_grid, 
+                         region, components, fields)
+        for iF in bag.fields:
+            try:
+                if bag.region is not None and bag.data is None:
+                    values = __readregion(ffb, bag.offsetFields[iF], bag.numbertype, 
+                                          bag.nComp, bag.lattice, bag.region)
+                else:
+                    values = __readblock(ffb, bag.data, bag.offsetFields[iF], 
+                                         bag.numbertype, bag.nComp*int(bag.lattice.prod()))
+                    values.shape = (values.shape[0]//bag.nComp, bag.nComp)
+                    values = values.reshape(list(bag.lattice)+[bag.nComp], order='F')
+                    if bag.region is not None:
+                        values = values[bag.region[0], bag.region[1], bag.region[2]]
+            except: raise RuntimeError('Corrupted file')
+
+            if bag.indices is not None:
+                pol_data = values
+                values = np.ndarray(list(pol_data.shape[0 : 3])+[3], dtype=bag.numbertype)
+                values.fill(0.0)
+                values[..., bag.indices] = pol_data
+
+            if bag.components is not None:
+                values = values[..., bag.components]
+
+            yield iF, values.reshape(bag.shape, order='F')
+
+
+def __readblock(ffb, data, offset, dtype, count):
+    """
+    Reads count values at byte position offset. If data is a memory map 
+    of the file, a view into the map is returned.
+    """
+
+    import numpy as np
+
+    if data is not None:
+        nBytes = count*np.dtype(dtype).itemsize
+        if offset+nBytes > data.shape[0]: raise EOFError()
+        return data[offset : offset+nBytes].view(dtype)
+    ffb.seek(offset)
+    values = np.fromfile(ffb, dtype, count)
+    if values.shape[0] != count: raise EOFError()
+    return values
+
+
+def __regionslices(region, lattice):
+    """
+    Converts a region dictionary into a list of slices for the three grid 
+    directions.
+    """
+    slices = list()
+    for iX, axis in enumerate(['x', 'y', 'z']):
+        s = region.get(axis, slice(None))
+        if isinstance(s, int):
+            s = range(0, int(lattice[iX]))[s]
+            s = slice(s, s+1)
+        elif not isinstance(s, slice):
+            raise TypeError('region -> slice or integer expected for key `%s`.' % (axis,))
+        slices.append(s)
+    return slices
+
+
+def __readregion(ffb, offset, dtype, nComp, lattice, region):
+    """
+    Reads the values of a field block at the grid points selected by region. 
+    Contiguous runs of selected points are read at once, all other bytes 
+    of the field block are skipped.
+    """
+    import numpy as np
+
+    pointSize = np.dtype(dtype).itemsize*nComp
+    indices = [np.arange(0, lattice[iX])[region[iX]] for iX in range(0, 3)]
+    shape = [iI.shape[0] for iI in indices]
+
+    # point indices in Fortran ordering of the lattice
+    iP = (indices[0].reshape(-1, 1, 1) + 
+          lattice[0]*indices[1].reshape(1, -1, 1) +
+          lattice[0]*lattice[1]*indices[2].reshape(1, 1, -1)).ravel(order='F')
+    iPUnique, iPInverse = np.unique(iP, return_inverse=True)
+    values = np.ndarray([iPUnique.shape[0], nComp], dtype=dtype)
+
+    # small gaps between selected points are read over
+    maxGap = max(1, 4096//pointSize)
+    breaks = list(np.nonzero(np.diff(iPUnique) > maxGap)[0]+1)
+    for start, end in zip([0]+breaks, breaks+[iPUnique.shape[0]]):
+        if end==start: continue
+        first = int(iPUnique[start])
+        count = int(iPUnique[end-1])-first+1
+        ffb.seek(offset+first*pointSize)
+        run = np.fromfile(ffb, dtype, count*nComp)
+        if run.shape[0] != count*nComp: raise EOFError()
+        run.shape = (count, nComp)
+        values[start : end] = run[iPUnique[start : end]-first]
+
+    return values[iPInverse.ravel()].reshape(shape+[nComp], order='F')
@@ -16,13 +16,19 @@ import jcmwave
 from jcmwave import nested_dict
 import jcmwave.__private as __private
 
-def loadtable(file_name, format='named'):
+def loadtable(file_name, format='named', cache=False):
     """
     Loads data from .jcm file stored in JCM table format.
 
     :param filepath file_name: path to a .jcm table file
 
     :param str format: output format of the loaded table (see below).  
+
+    :param cache: If set to ``True``, the loaded table is stored in the directory
+        ``<file_name>.cache`` as .npy files and reloaded from there as long as 
+        size and modification time of the table file are unchanged. With 
+        ``cache='compressed'`` a compressed archive ``<file_name>.npz`` is 
+        used instead (default: False).
     
     :returns:
     
@@ -126,6 +132,15 @@ def loadtable(file_name, format='named'):
     if not isinstance(format, str) or not (format in ['named', 
          'list', 'matrix']):
         raise TypeError('Invalid table format')
+
+    if not (cache is True or cache is False or cache == 'compressed'):
+        raise TypeError("cache -> boolean or 'compressed' expected.")
+
+    if cache:
+        options = dict(loader='loadtable', format=format)
+        compressed = cache == 'compressed'
+        table = __private.loadcache(file_name, options, compressed)
+        if table is not None: return table
     
     with open(file_name, 'rb') as ft:
 
@@ -150,10 +165,91 @@ def loadtable(file_name, format='named'):
 
             if atEnd: break
        
-    if len(tables) == 1:
-        return tables[0]
-    else:
-        return tables
+    if len(tables) == 1: table = tables[0]
+    else: table = tables
+
+    if cache: __private.savecache(file_name, options, table, compressed)
+    return table
+
+# patterns of the text table reader
+__NEXT_HEADER = re.compile(b'^[ ]*/[ ]*[*][ ]*<BLOBHead>', re.MULTILINE)
+__COMMENT = re.compile(r'#[^\n]*')
+__COMPLEX_SEPARATORS = str.maketrans('(,)', '   ')
+
+def loadtabletext_(ft, columns, nRows):
+    """
+    Reads the data section of a text table at once and converts it with numpy. 
+    Raises a ValueError if the section can't be converted, in which case
+    the caller falls back to the token-wise reader.
+    """
+    import numpy as np
+
+    pos = ft.tell()
+    text = ft.read()
+    end = len(text)
+    if text.find(b'<BLOBHead>')!=-1:
+        nextHeader = __NEXT_HEADER.search(text)
+        if nextHeader is not None: end = nextHeader.start()
+    text = text[0 : end].decode()
+
+    # drop comments, split complex numbers (re,im) into two tokens
+    if text.find('#')!=-1: text = __COMMENT.sub('', text)
+    text = text.translate(__COMPLEX_SEPARATORS)
+
+    widths = [2 if iC['type']=='complex128' else 1 for iC in columns]
+    nTokens = nRows*sum(widths)
+    tokens = text.split()
+    if len(tokens) < nTokens: raise ValueError('Missing table entries.')
+    values = np.array(tokens[0 : nTokens], dtype='float64')
+    values.shape = (nRows, sum(widths))
+
+    iV = 0
+    for iC, width in zip(columns, widths):
+        if iC['type']=='complex128':
+            iC['data'] = np.ndarray([nRows,], dtype='complex128')
+            iC['data'].real = values[:, iV]
+            iC['data'].imag = values[:, iV+1]
+        elif iC['type']=='int32':
+            if not np.array_equal(values[:, iV], np.trunc(values[:, iV])):
+                raise ValueError('Non-integer entry in integer column.')
+            iC['data'] = values[:, iV].astype('int32')
+        else: iC['data'] = values[:, iV].copy()
+        iV+=width
+    ft.seek(pos+end)
+
+# nested-dict paths of the columns of already loaded tables
+__schema_cache = dict()
+
+def columnpath_(key):
+    """
+    Returns the path of a column in the nested table dictionary and the 
+    index of the column's component (X=0,Y=1,Z=2, -1 for scalar columns).
+    """
+
+    # Placeholder <DerivativeSep> serves as split indicator to turn the kay into
+    # a path of the nested dict 
+    def placeholder(m): return 'd_%s<DerivativeSep>%s' % (m.group(2), m.group(1))
+    key = re.sub('d\((.*)\)_(.*)', placeholder, key)
+    key = re.sub('d\((.*)\)_(.*)', placeholder, key)
+   
+    nameIndices = list()
+    while True:  				
+        nameIndex = re.search('(.*)(_\d{1,})',  key)
+        if nameIndex is None: break
+        key = nameIndex.group(1)
+        nameIndices.append(int(nameIndex.group(2)[1 : ])-1)
+    nameIndices.reverse()
+      
+    #determine index (X=0,Y=1,Z=2)
+    index=-1
+    if  key[-1] == 'X': index = 0
+    elif key[-1] == 'Y': index = 1  
+    elif key[-1] == 'Z': index = 2  
+    if index > -1: key = key[:-1]
+
+    #set path to value in nested dict
+    path = key.split('<DerivativeSep>') + nameIndices
+    return (path, index)
 
 def loadtable_(ft, format='named'):
 
@@ -187,7 +283,11 @@ def loadtable_(ft, format='named'):
             for iC in columns:
                 iC['data']=np.fromfile(ft, iC['type'], nRows)
         else:
+            pos = ft.tell()
             nEntries=nRows*nColumns
+            try: loadtabletext_(ft, columns, nRows)
+            except ValueError: ft.seek(pos)
+            else: nEntries = 0
             iE=0
             while iE<nEntries:
                 l=ft.readline().decode()
@@ -210,34 +310,16 @@ def loadtable_(ft, format='named'):
         table = np.matrix([iC['data'].flatten() for iC in columns])
         table = table.transpose()
     else:
-        last_path = ''
-        for iC in columns:
-            key = iC['name']
-            
-            # Placeholder <DerivativeSep> serves as split indicator to turn the kay into
-            # a path of the nested dict 
-            def placeholder(m): return 'd_%s<DerivativeSep>%s' % (m.group(2), m.group(1))
-            key = re.sub('d\((.*)\)_(.*)', placeholder, key)
-            key = re.sub('d\((.*)\)_(.*)', placeholder, key)
-           
-            nameIndices = list()
-            while True:  				
-                nameIndex = re.search('(.*)(_\d{1,})',  key)
-                if nameIndex is None: break
-                key = nameIndex.group(1)
-                nameIndices.append(int(nameIndex.group(2)[1 : ])-1)
-            nameIndices.reverse()
-              
-            #determine index (X=0,Y=1,Z=2)
-            index=-1
-            if  key[-1] == 'X': index = 0
-            elif key[-1] == 'Y': index = 1  
-            elif key[-1] == 'Z': index = 2  
-            if index > -1: key = key[:-1]
-
-            #set path to value in nested dict
-            path = key.split('<DerivativeSep>') + nameIndices
+        # column paths only depend on the column names and types
+        signature = tuple([(iC['name'], iC['type']) for iC in columns])
+        try: paths = __schema_cache[signature]
+        except KeyError:
+            paths = [columnpath_(iC['name']) for iC in columns]
+            if len(__schema_cache)>1000: __schema_cache.clear()
+            __schema_cache[signature] = paths
 
+        last_path = ''
+        for iC, (path, index) in zip(columns, paths):
             if index>-1:
                 if last_path != path:
                     try:
@@ -22,6 +22,8 @@ import re
 import inspect
 import warnings
 import shutil
+import uuid
+import time
 
 class Resultbag(object):
 
@@ -47,10 +49,32 @@ class Resultbag(object):
               jcmt-files or list of fieldnames. If keys is present, when adding or 
               getting results the keys dictionary is filtered to the prototypic 
               dictionary, such that other fieldnames in keys dictionary are ignored.
+     :param bool wal (optional): If True (default), the database is written in 
+              write-ahead-log mode, which needs far less disk synchronization per 
+              write. Set to False for a resultbag on a network file system (e.g. NFS), 
+              where write-ahead logs are not supported.
+     :param int cache_bytes (optional): Memory budget in bytes of the results kept
+              in memory after reading or adding them (default: 256 MB). The least 
+              recently used results are dropped from memory when the budget is exceeded.
+              Use ``resultbag.results.cache_info()`` to get the number of cache hits
+              and misses.
+     :param bool external_arrays (optional): If True, numpy arrays of 64 kB or more
+              contained in added results are stored as .npy files in the directory 
+              ``<filepath>.arrays`` instead of being pickled into the database. 
+              Only the remaining structure of the result is read from the database
+              and the arrays are returned memory-mapped (as ``numpy.memmap`` in 
+              copy-on-write mode), such that their data is read from disk on
+              access only. Results stored in this way can be read in any case
+              (default: False).
 
     '''
+
+    # version of the computation of tags from keys: 1 formats all keys as text,
+    # 2 hashes numbers and arrays rounded to the same precision in binary form
+    KEY_HASH_VERSION = 2
     
-    def __init__(self, filepath, keys = None):
+    def __init__(self, filepath, keys = None, wal = True, cache_bytes = None,
+                 external_arrays = False):
 
         #chose path relative to calling script 
         if not os.path.isabs(filepath):
@@ -65,7 +89,6 @@ class Resultbag(object):
                                    (file_name, dir_name))
             
         self._filepath =  os.path.realpath(filepath)
-        self._keys = dict()
 
         #set fieldnames
         if keys is None: fns = list()
@@ -78,9 +101,18 @@ class Resultbag(object):
             self.reset()
         
         
-        self.results = PersistentDict(filepath,'results')
-        self.config = PersistentDict(filepath,'config')
+        self.results = PersistentDict(filepath,'results', wal = wal, 
+                                      cache_bytes = cache_bytes,
+                                      external_arrays = external_arrays)
+        self.config = PersistentDict(filepath,'config', database = self.results)
+        self._jobs = RunningJobTable(self.results)
         self.config['fieldnames'] = fns
+        if 'key_hash' not in self.config:
+            # the results of older resultbags keep their tags
+            if self.results.count() > 0: self.config['key_hash'] = 1
+            else: self.config['key_hash'] = self.KEY_HASH_VERSION
+        self._key_hash = self.config['key_hash']
+        self._tag_memo = dict() # digest of pickled filtered keys -> tag
         
                   
     ## Methods for handling keys
@@ -88,8 +120,106 @@ class Resultbag(object):
     def _to_md5(self, keys = None, string = None):
         #Get md5 string for string or keys dictionary
         if keys is not None :
+            if self._key_hash >= 2:
+                #tag of same length as md5 tag
+                hasher = hashlib.blake2b(digest_size = 16)
+                self._keys_digest(keys, hasher)
+                return hasher.hexdigest()
             string = self._keys_to_string(keys)
         return hashlib.md5(string.encode()).hexdigest()
+
+    def _key_tag(self, keys):
+        #Get tag of filtered keys. The tag is memoized by the digest of the 
+        #pickled keys, such that keys modified in place get a new tag. Hence,
+        #a memoized tag still costs pickling and hashing the keys (about 2 us 
+        #for scalar keys, a third of the time of the tag for large lists and
+        #arrays), since an identity check cannot detect modifications.
+        filtered_keys = self._filter_keys(keys)
+        try: digest = hashlib.blake2b(pickle.dumps(filtered_keys, pickle.HIGHEST_PROTOCOL),
+                                      digest_size = 16).digest()
+        except Exception: return self._to_md5(keys = filtered_keys)
+        tag = self._tag_memo.get(digest)
+        if tag is not None: return tag
+        tag = self._to_md5(keys = filtered_keys)
+        if len(self._tag_memo) >= 4096: self._tag_memo.clear()
+        self._tag_memo[digest] = tag
+        return tag
+
+    def _keys_digest(self, data, hasher, N=12):
+        #Feed canonical binary representation of keys into hasher. As for 
+        #_keys_to_string numbers are given with N digits of precision and
+        #arrays are divided by their absolute maximum.
+        update = hasher.update
+
+        if isinstance(data, dict):
+            update(b'{')
+            for key in sorted(list(data.keys())):
+                update(('\n%s:' % key).encode())
+                self._keys_digest(data[key], hasher, N)
+            update(b'}')
+            return
+
+        if isinstance(data, set):
+            #order of set does not matter
+            digests = []
+            for value in data:
+                element_hasher = hashlib.blake2b(digest_size = 16)
+                self._keys_digest(value, element_hasher, N)
+                digests.append(element_hasher.digest())
+            update(b'S%d:' % len(digests) + b''.join(sorted(digests)))
+            return
+
+        if isinstance(data, str):
+            data = data.encode('utf-8', 'surrogatepass')
+            update(b's%d:' % len(data))
+            update(data)
+            return
+
+        if isinstance(data, (bool, np.bool_)):
+            #as for _keys_to_string booleans differ from the numbers 0 and 1
+            update(b'b1' if data else b'b0')
+            return
+
+        if isinstance(data, (int, float, np.integer, np.floating)):
+            update(('r%.*e' % (N, data)).encode())
+            return
+
+        if isinstance(data, complex): data = [data]
+        if isinstance(data, (list, tuple)):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                try: array = np.asarray(data)
+                except ValueError: array = None # nested lists of different lengths
+        elif isinstance(data, np.ndarray): array = data
+        else:
+            #fallback: pickle object (with warning)
+            update(b'o')
+            update(self._keys_to_string(data, N).encode())
+            return
+
+        if array is None or array.dtype.kind not in 'biufc':
+            #For more complex data (e.g. list of numpy arrays): iterate over entries
+            update(b'[')
+            for value in data:
+                self._keys_digest(value, hasher, N)
+                update(b' ')
+            update(b']')
+            return
+
+        array = np.asarray(array).ravel()
+        if array.dtype.kind != 'c':
+            if array.size == 1: 
+                update(('r%.*e' % (N, array[0])).encode())
+                return
+            array = array.astype(np.float64)
+        else: array = array.astype(np.complex128)
+        m = float(np.max(np.abs(array))) if array.size > 0 else 0.0
+        update(('%s%d %.*e:' % (array.dtype.kind, array.size, N, m)).encode())
+        if m > 0.0 and np.isfinite(m):
+            array = array / m
+            if array.dtype.kind == 'c': array = array.view(np.float64)
+            update(np.rint(array * 10.0**N).astype('<i8').tobytes())
+        elif m != 0.0: update(array.tobytes()) # NaN or infinite values
         
     def _keys_to_string(self,data,N=12):
 
@@ -194,6 +324,25 @@ class Resultbag(object):
         return self._to_md5(string = content)
     
     ## Public methods
+
+    def batch(self):
+        """Purpose: Group all writes to the resultbag into a single transaction
+        which is committed at the end of the with-block. Example::
+
+            with resultbag.batch():
+                for keys, result in zip(keys_list, results):
+                    resultbag.add(keys = keys, result = result)
+
+        Other threads writing to the resultbag wait until the block is left.
+        """
+        return self.results.batch()
+
+    def close(self):
+        """Purpose: Close the database file of the resultbag. 
+        Usage: resultbag.close()
+
+        """
+        self.results.close()
     
     def reset(self):
         """Purpose: Clear all results in resultbag. 
@@ -202,6 +351,12 @@ class Resultbag(object):
         """    
         #Reset the resultbag (deletes all results, creates backup before)
         self.results.clear()
+        #an empty resultbag can use the latest computation of tags
+        self.config['key_hash'] = self._key_hash = self.KEY_HASH_VERSION
+        self._tag_memo = dict()
+        with self.batch():
+            for id, (_, keys) in list(self._jobs.items()):
+                self._jobs.add(id, self._key_tag(keys), keys)
 
     def backup(self,backup_path=None):
         """Purpose: Create a backup of the resultbag. If no backup_path is provided, it is derived from the resultbag's name.
@@ -214,7 +369,7 @@ class Resultbag(object):
         if filepath_bkp is None: 
             [fpath,ext]=os.path.splitext(self._filepath)
             filepath_bkp =fpath+'_bkp'+ext
-        try: shutil.copyfile(self._filepath,filepath_bkp)
+        try: self.results.backup(filepath_bkp)
         except: 
             raise EnvironmentError('Can`t backup resultbag {0} to {1}.'.format(self._filepath,filepath_bkp))
         
@@ -232,8 +387,7 @@ class Resultbag(object):
            
         # Get tag for specific keys
 
-        filtered_keys = self._filter_keys(keys)
-        return self._to_md5(keys = filtered_keys)
+        return self._key_tag(keys)
 
     ## Handling of job ids
 
@@ -246,7 +400,7 @@ class Resultbag(object):
         #Associate keys struct to specific job id
 
         assert type(keys) is dict, "keys is not a dict: %r" % keys
-        self._keys[id] = self._filter_keys(keys)
+        self._jobs.add(id, self._key_tag(keys), self._filter_keys(keys))
 
     def is_running(self, keys):    
         """Check if computation of keys is running
@@ -254,24 +408,16 @@ class Resultbag(object):
         Internal method used by :func:`jcmwave.solve` or :func:`jcmwave.daemon.wait`
         """
         #Check if a comutation with specific keys is running (valid job id)
-        filtered_keys = self._filter_keys(keys)
-        try:
-            for key in self._keys.values(): 
-                if (key == filtered_keys): return True
-        except:
-            fkeys = self._keys_to_string(filtered_keys)
-            for key in self._keys.values(): 
-                if (self._keys_to_string(key) == fkeys): return True
-
-        return False
+        return self._jobs.has_tag(self._key_tag(keys))
 
     def release(self, id):
-        """Release job id
+        """Release job id or list of job ids
 
         Internal method used by :func:`jcmwave.solve` or :func:`jcmwave.daemon.wait`
         """
-        #Release job id
-        del self._keys[id]
+        #Release job ids
+        if isinstance(id, (list, tuple, set)): self._jobs.remove(id)
+        else: self._jobs.remove([id])
 
     def release_all(self):
         """In daemon mode jcmwave.solve associates the job to a 
@@ -290,7 +436,7 @@ class Resultbag(object):
         """
         # Release all job ids in resultbag
 
-        self._keys = dict()
+        self._jobs.clear()
 
     def get_keys_by_job_id(self, id):
         """Get keys of job id
@@ -298,10 +444,15 @@ class Resultbag(object):
         Internal method used by :func:`jcmwave.solve` or :func:`jcmwave.daemon.wait`
         """
         #Get keys struct for specific job id
-        if id not in self._keys:
+        return self._get_job(id)[1]
+
+    def _get_job(self, id):
+        #Get tag and keys struct of job id
+        job = self._jobs.job(id)
+        if job is None:
             raise EnvironmentError( 'The job id does not exist in the result bag.\
             Please call jcmwave_solve with the resultbag parameter.')
-        return self._keys[id]
+        return job
 
     ## Handling of results
 
@@ -317,10 +468,10 @@ class Resultbag(object):
         assert type(result) is list, "Added result is not a list: %r" % result
         assert type(log) is dict, "Added log is not a dict: %r" % log
 
-        if keys is not None: filtered_keys = self._filter_keys(keys)
-        else: filtered_keys = self._keys[id]
-     
-        md5 = self._to_md5(keys = filtered_keys)
+        if keys is not None: 
+            filtered_keys = self._filter_keys(keys)
+            md5 = self._key_tag(keys)
+        else: md5, filtered_keys = self._get_job(id)
         result = {
             'keys': filtered_keys,
             'result': result,
@@ -339,9 +490,8 @@ class Resultbag(object):
         """
         # Get result for specific keys
 
-        filtered_keys = self._filter_keys(keys)
-        md5 = self._to_md5(keys = filtered_keys)
-        if md5 not in self.results.keys():
+        md5 = self._key_tag(keys)
+        if md5 not in self.results:
             raise EnvironmentError('Result for keys with tag %s does not exist.' % md5)
 
         res = self.results[md5]['result']
@@ -361,9 +511,8 @@ class Resultbag(object):
         """
         # Get log for specific keys
         
-        filtered_keys = self._filter_keys(keys)
-        md5 = self._to_md5(keys = filtered_keys)
-        if md5 not in self.results.keys():
+        md5 = self._key_tag(keys)
+        if md5 not in self.results:
             raise EnvironmentError('Log for keys with tag %s does not exist.' % md5)
 
         return self.results[md5]['log']
@@ -379,10 +528,9 @@ class Resultbag(object):
         """
         #Check if result for specific keys exists
 
-        filtered_keys = self._filter_keys(keys)
-        md5 = self._to_md5(keys = filtered_keys)
+        md5 = self._key_tag(keys)
         
-        return md5 in self.results.keys() and 'result' in self.results[md5]
+        return md5 in self.results and 'result' in self.results[md5]
 
     def has_results(self):
         """Check if any results are registered
@@ -403,8 +551,9 @@ class Resultbag(object):
         """
         # Remove result and log for keys meeting certain conditions from
         
-        for md5, result in self.results.items():
-            if fun(result['keys']): del self.results[md5]
+        with self.batch():
+            for md5, result in list(self.results.items()):
+                if fun(result['keys']): del self.results[md5]
             
     def remove_result(self, keys):
         """Remove result and log for specific keys. Example::
@@ -416,8 +565,7 @@ class Resultbag(object):
         """
         # Remove result and log for keys meeting certain conditions from
         
-        filtered_keys = self._filter_keys(keys)
-        md5 = self._to_md5(keys = filtered_keys)
+        md5 = self._key_tag(keys)
         del self.results[md5]
         
     ## Handling of source files
@@ -463,10 +611,11 @@ class Resultbag(object):
         source_files = self.config['source_files']
       
         #check files
+        changed = False
         for file in files:
             file = os.path.realpath(file)
             (_, file_name) = os.path.split(file)
-            md5 = self._to_md5(file_name)
+            md5 = self._to_md5(string = file_name)
           
             # check if filenames changed
             if md5 not in source_files: return False
@@ -482,20 +631,69 @@ class Resultbag(object):
                 else:
                     #update timestamp
                     source_files[md5]['timestamp'] = timestamp
+                    changed = True
 
-        self.config['source_files'] = source_files
+        if changed: self.config['source_files'] = source_files
       
         return True
 
 import sqlite3
 import threading
+import collections
+
+class _ArrayRef(object):
+    # reference to an array stored as .npy file in the array directory of a key
+    def __init__(self, file_name = None, shape = None, matrix = False):
+        self.file_name = file_name
+        self.shape = shape # shape of a broadcast view
+        self.matrix = matrix
+
+class _Manifest(object):
+    # value whose large arrays are replaced by _ArrayRef
+    def __init__(self, data, file_names):
+        self.data = data
+        self.file_names = file_names
+
 class PersistentDict(dict):
-    def __init__(self, filepath, name):
-        self._cache = dict()
+    DEFAULT_CACHE_BYTES = 256*1024**2
+    INLINE_BYTES = 65536 # smaller arrays are pickled with the value
+
+    def __init__(self, filepath, name, database = None, wal = True, cache_bytes = None,
+                 external_arrays = False):
+        # database: PersistentDict of the same file whose connection is shared,
+        # such that a batch covers the writes to both tables
+        # cache_bytes: memory budget of the LRU cache of unpickled values
+        # external_arrays: store large arrays of written values as .npy files
+        # in <filepath>.arrays/<name>/<key>, which are memory-mapped when read
+        if cache_bytes is None: cache_bytes = self.DEFAULT_CACHE_BYTES
+        if not isinstance(cache_bytes, int) or cache_bytes < 0:
+            raise TypeError('cache_bytes -> non-negative integer expected.')
+        self._cache = collections.OrderedDict() # key -> (value, size)
+        self._cache_bytes = 0
+        self._cache_max_bytes = cache_bytes
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
         self._filepath = filepath
-        self._connection = sqlite3.connect(filepath, check_same_thread=False)
         self._name = name
-        self._lock = threading.Lock()
+        self._array_dir = filepath + '.arrays'
+        self._external_arrays = external_arrays
+        if database is not None:
+            self._connection = database._connection
+            self._lock = database._lock
+            self._batch_depth = database._batch_depth
+            self._obsolete_files = database._obsolete_files
+        else:
+            self._connection = sqlite3.connect(filepath, check_same_thread=False)
+            self._lock = threading.RLock()
+            self._batch_depth = [0] # shared by all tables of the connection
+            # array files (and directories) removed after the next commit
+            self._obsolete_files = []
+            if wal:
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                # commits are durable at the next checkpoint, the database
+                # is consistent in any case
+                self._connection.execute('PRAGMA synchronous=NORMAL')
         c = self._connection.cursor()
         c.execute(
           'CREATE TABLE IF NOT EXISTS "%s" (key TEXT PRIMARY KEY, value BLOB)'%
@@ -504,25 +702,37 @@ class PersistentDict(dict):
 
     def __setitem__(self,key,value):
         with self._lock:
-            self._cache[key] = value
             c = self._connection.cursor()
-            value = pickle.dumps(value)
+            stored, nbytes = value, 0
+            if self._external_arrays: stored, nbytes = self._split(key, value)
+            blob = pickle.dumps(stored)
+            self._cache_put(key, value, len(blob) + nbytes)
             c.execute("REPLACE INTO %s (key, value) VALUES (?,?)" %
-                      self._name, (key,value))
-            self._connection.commit()
+                      self._name, (key,blob))
+            if os.path.isdir(self._array_dir):
+                self._remove_arrays(key, getattr(stored, 'file_names', []))
+            self._commit()
 
     def __getitem__(self,key):
-        if key in self._cache: return self._cache[key]
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return self._cache[key][0]
+            self._misses += 1
         c = self._connection.cursor()
         c.execute('SELECT value FROM %s WHERE key=?' % self._name, (key,))
         result = c.fetchone()
         if result is None: raise KeyError(key)
         value = self.unpickle(result[0])
-        self._cache[key] = value
+        # memory-mapped arrays are not counted, their pages can be dropped by the OS
+        if isinstance(value, _Manifest): value = self._join(key, value)
+        self._cache_put(key, value, len(result[0]))
         return value
 
     def __contains__(self, key):
-        if key in self._cache: return True
+        with self._cache_lock:
+            if key in self._cache: return True
         c = self._connection.cursor()
         c.execute('SELECT 1 FROM %s WHERE key=?' % self._name, (key,))
         result = c.fetchone()
@@ -532,15 +742,169 @@ class PersistentDict(dict):
         with self._lock:
             c = self._connection.cursor()
             c.execute('DELETE FROM %s WHERE key=?' % self._name,(key,))
-            self._connection.commit()
-            del self._cache[key]
+            self._remove_arrays(key)
+            self._commit()
+            with self._cache_lock: self._cache_pop(key)
     
     def clear(self):
         with self._lock:
             c = self._connection.cursor()
             c.execute("DELETE FROM %s" % self._name)
+            table_dir = os.path.join(self._array_dir, self._name)
+            for dir_name, _, file_names in os.walk(table_dir, topdown = False):
+                self._obsolete_files += [os.path.join(dir_name, f) for f in file_names]
+                self._obsolete_files.append(dir_name)
+            self._commit()
+            with self._cache_lock:
+                self._cache.clear()
+                self._cache_bytes = 0
+
+    def _key_dir(self, key):
+        if not re.match(r'^\w+$', key): key = hashlib.md5(key.encode()).hexdigest()
+        return os.path.join(self._array_dir, self._name, key)
+
+    def _split(self, key, value):
+        # Writes the large arrays of value to new .npy files and returns the 
+        # manifest of value and the number of bytes written. Files are never
+        # overwritten, such that memory maps of earlier reads stay valid.
+        arrays = []
+        data = self._split_arrays(value, arrays)
+        if len(arrays) == 0: return value, 0
+        key_dir = self._key_dir(key)
+        if not os.path.isdir(key_dir): os.makedirs(key_dir)
+        token = uuid.uuid4().hex
+        nbytes = 0
+        for i, (ref, array) in enumerate(arrays):
+            ref.file_name = '%s_%d.npy' % (token, i)
+            with open(os.path.join(key_dir, ref.file_name), 'wb') as f: 
+                np.save(f, array, allow_pickle = False)
+            nbytes += array.nbytes
+        return _Manifest(data, [ref.file_name for ref, _ in arrays]), nbytes
+
+    def _split_arrays(self, data, arrays):
+        if isinstance(data, dict):
+            return dict([(k, self._split_arrays(v, arrays)) for k, v in data.items()])
+        if isinstance(data, list):
+            return [self._split_arrays(v, arrays) for v in data]
+        if isinstance(data, tuple):
+            return tuple([self._split_arrays(v, arrays) for v in data])
+        if (isinstance(data, np.ndarray) and data.dtype != object and 
+            data.nbytes >= self.INLINE_BYTES):
+            if data.ndim > 0 and 0 in data.strides:
+                # broadcast view: store the compact base only
+                base = data[tuple(slice(None) if s else slice(0, 1)
+                                  for s in data.strides)]
+                arrays.append((_ArrayRef(shape = data.shape), np.ascontiguousarray(base)))
+            else:
+                arrays.append((_ArrayRef(matrix = isinstance(data, np.matrix)),
+                               np.asarray(data)))
+            return arrays[-1][0]
+        return data
+
+    def _join(self, key, manifest):
+        return self._join_arrays(manifest.data, self._key_dir(key))
+
+    def _join_arrays(self, data, key_dir):
+        if isinstance(data, dict):
+            return dict([(k, self._join_arrays(v, key_dir)) for k, v in data.items()])
+        if isinstance(data, list):
+            return [self._join_arrays(v, key_dir) for v in data]
+        if isinstance(data, tuple):
+            return tuple([self._join_arrays(v, key_dir) for v in data])
+        if isinstance(data, _ArrayRef):
+            array = np.load(os.path.join(key_dir, data.file_name), mmap_mode = 'c')
+            if data.shape is not None: array = np.broadcast_to(array, data.shape)
+            if data.matrix: array = np.asmatrix(array)
+            return array
+        return data
+
+    def _remove_arrays(self, key, keep = ()):
+        # schedules the removal of the array files of key except for keep
+        key_dir = self._key_dir(key)
+        try: file_names = os.listdir(key_dir)
+        except OSError: return
+        self._obsolete_files += [os.path.join(key_dir, f) for f in file_names 
+                                 if f not in keep]
+        if len(keep) == 0: self._obsolete_files.append(key_dir)
+
+    def _cache_put(self, key, value, size):
+        # The size of a value is estimated by the length of its pickle, which
+        # contains the raw data of numpy arrays (i.e. their nbytes)
+        with self._cache_lock:
+            self._cache_pop(key)
+            if size > self._cache_max_bytes: return
+            self._cache[key] = (value, size)
+            self._cache_bytes += size
+            while self._cache_bytes > self._cache_max_bytes:
+                _, (_, size) = self._cache.popitem(last = False)
+                self._cache_bytes -= size
+
+    def _cache_pop(self, key):
+        entry = self._cache.pop(key, None)
+        if entry is not None: self._cache_bytes -= entry[1]
+
+    def cache_info(self):
+        """
+        Returns the number of cache hits and misses of reads, the number of
+        cached values and their estimated size in bytes. 
+        """
+        with self._cache_lock:
+            return dict(hits = self._hits, misses = self._misses, 
+                        entries = len(self._cache), bytes = self._cache_bytes,
+                        max_bytes = self._cache_max_bytes)
+
+    def _commit(self):
+        if self._batch_depth[0] > 0: return
+        self._connection.commit()
+        # array files are removed once the database does not refer to them anymore
+        for path in self._obsolete_files:
+            try:
+                if os.path.isdir(path): os.rmdir(path) # only if empty
+                else: os.remove(path)
+            except OSError: pass # e.g. memory-mapped file on Windows
+        del self._obsolete_files[:]
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager which groups all writes to the tables of the connection 
+        into a single transaction. Batches can be nested.
+        """
+        with self._lock:
+            self._batch_depth[0] += 1
+            try: yield self
+            finally:
+                self._batch_depth[0] -= 1
+                self._commit()
+
+    def backup(self, filepath):
+        """
+        Writes a consistent copy of the database (including the write-ahead log)
+        to filepath.
+        """
+        with self._lock:
+            self._connection.commit()
+            if hasattr(self._connection, 'backup'):
+                target = sqlite3.connect(filepath)
+                try: self._connection.backup(target)
+                finally: target.close()
+            else: 
+                self._connection.execute('PRAGMA wal_checkpoint(FULL)')
+                shutil.copyfile(self._filepath, filepath)
+            if os.path.isdir(self._array_dir):
+                # array files are never modified and can be shared by hard links
+                def link(src, dst):
+                    try: os.link(src, dst)
+                    except (OSError, AttributeError): shutil.copy2(src, dst)
+                if os.path.isdir(filepath + '.arrays'): 
+                    shutil.rmtree(filepath + '.arrays')
+                shutil.copytree(self._array_dir, filepath + '.arrays', 
+                                copy_function = link)
+
+    def close(self):
+        with self._lock:
             self._connection.commit()
-            self._cache = dict()
+            self._connection.close()
 
     def keys(self):
         c = self._connection.cursor()
@@ -548,10 +912,16 @@ class PersistentDict(dict):
             yield key[0]
 
     def items(self):
+        # rows are streamed without keeping them in the cache
         c = self._connection.cursor()
         for key,value in c.execute("SELECT key, value FROM %s" % self._name):
+            with self._cache_lock:
+                entry = self._cache.get(key)
+            if entry is not None: 
+                yield key, entry[0]
+                continue
             value = self.unpickle(value)
-            self._cache[key] = value
+            if isinstance(value, _Manifest): value = self._join(key, value)
             yield key, value
 
     def unpickle(self,value):
@@ -568,6 +938,72 @@ class PersistentDict(dict):
         counter = c.execute("SELECT COUNT(*) FROM %s" % self._name)
         values = counter.fetchone()
         return values[0]
+
+class RunningJobTable(object):
+    # Running jobs of a resultbag with the tags and filtered keys of the jobs
+    # indexed by job id and tag. The table is temporary, i.e. it is private to 
+    # the connection of the PersistentDict database and removed on closing.
+    def __init__(self, database):
+        self._database = database
+        self._connection = database._connection
+        self._lock = database._lock
+        c = self._connection.cursor()
+        c.execute('CREATE TEMP TABLE IF NOT EXISTS running_jobs '
+                  '(job_id INTEGER PRIMARY KEY, tag TEXT, keys BLOB, timestamp REAL)')
+        c.execute('CREATE INDEX IF NOT EXISTS temp.running_jobs_tag ON running_jobs (tag)')
+        self._connection.commit()
+
+    def add(self, job_id, tag, keys):
+        with self._lock:
+            c = self._connection.cursor()
+            c.execute('REPLACE INTO running_jobs (job_id, tag, keys, timestamp) '
+                      'VALUES (?,?,?,?)', (int(job_id), tag, pickle.dumps(keys), time.time()))
+            self._database._commit()
+
+    def job(self, job_id):
+        # returns tag and keys of the job or None
+        c = self._connection.cursor()
+        c.execute('SELECT tag, keys FROM running_jobs WHERE job_id=?', (int(job_id),))
+        result = c.fetchone()
+        if result is None: return None
+        return result[0], self._database.unpickle(result[1])
+
+    def has_tag(self, tag):
+        c = self._connection.cursor()
+        c.execute('SELECT 1 FROM running_jobs WHERE tag=? LIMIT 1', (tag,))
+        return c.fetchone() is not None
+
+    def remove(self, job_ids):
+        with self._lock:
+            c = self._connection.cursor()
+            c.executemany('DELETE FROM running_jobs WHERE job_id=?', 
+                          [(int(job_id),) for job_id in job_ids])
+            self._database._commit()
+
+    def clear(self):
+        with self._lock:
+            c = self._connection.cursor()
+            c.execute('DELETE FROM running_jobs')
+            self._database._commit()
+
+    def items(self):
+        c = self._connection.cursor()
+        for job_id, tag, keys in c.execute('SELECT job_id, tag, keys FROM running_jobs'):
+            yield job_id, (tag, self._database.unpickle(keys))
+
+    def count(self):
+        c = self._connection.cursor()
+        return c.execute('SELECT COUNT(*) FROM running_jobs').fetchone()[0]
+
+    def __eq__(self, other):
+        # tables are equal if they contain the same jobs
+        if not isinstance(other, RunningJobTable): return NotImplemented
+        c = self._connection.cursor()
+        jobs = c.execute('SELECT job_id, tag FROM running_jobs ORDER BY job_id').fetchall()
+        c = other._connection.cursor()
+        return jobs == c.execute('SELECT job_id, tag FROM running_jobs ORDER BY job_id').fetchall()
+
+    __hash__ = None
         
 if __name__=='__main__':
     import unittest
@@ -587,6 +1023,17 @@ if __name__=='__main__':
             rb = Resultbag('test.rbg',self.keys)
             self.assertEqual(rb.__dict__, self.resultbag.__dict__)
 
+        def test_running_job_table(self):
+            # the tables of running jobs are equal if they hold the same jobs
+            rb = Resultbag('test.rbg',self.keys)
+            self.assertEqual(rb._jobs, self.resultbag._jobs)
+            self.resultbag.set_job_id({'radius': 2.0}, 7)
+            self.assertNotEqual(rb._jobs, self.resultbag._jobs)
+            rb.set_job_id({'radius': 2.0}, 7)
+            self.assertEqual(rb._jobs, self.resultbag._jobs)
+            self.assertRaises(TypeError, hash, rb._jobs)
+            rb.close()
+
         def test_keys_to_string(self):
             #compare keys with precision of 4 significant bits (3 after dot)
             keys1 = {
@@ -616,6 +1063,47 @@ if __name__=='__main__':
             self.assertEqual(str1,str2)
             self.assertNotEqual(str1,str3)
         
+        def test_key_hash(self):
+            self.assertEqual(self.resultbag._key_hash, Resultbag.KEY_HASH_VERSION)
+            self.resultbag.config['fieldnames'] = [] # tags of all keys
+            keys1 = {'radius': 1.0, 'n': np.array([[1000, 2, complex(3, 1)], [4, 5, 0.001]]),
+                     'name': 'abc', 'points': [(0, 0), (1.5, 0)], 'set': {1, 'a'}}
+            keys2 = {'radius': 1, 'n': np.array([[1000, 2+1e-10, complex(3, 1)], [4, 5, 0.001]]),
+                     'name': 'abc', 'points': [[0.0, 0.0], [1.5, 0.0]], 'set': {'a', 1.0}}
+            tag = self.resultbag.get_tag(keys1)
+            self.assertEqual(tag, self.resultbag.get_tag(keys2))
+            self.assertEqual(len(tag), 32)
+            # memoized tags are updated after modifications of the keys
+            keys1['n'][0, 0] = 1001
+            self.assertNotEqual(tag, self.resultbag.get_tag(keys1))
+            keys1['n'][0, 0] = 1000
+            self.assertEqual(tag, self.resultbag.get_tag(keys1))
+            keys1['points'].append((0, 1))
+            self.assertNotEqual(tag, self.resultbag.get_tag(keys1))
+            # memo of numpy scalar keys
+            keys3 = {'radius': np.float64(1.5), 'flag': np.bool_(True)}
+            tag = self.resultbag.get_tag(keys3)
+            n_memo = len(self.resultbag._tag_memo)
+            self.assertEqual(tag, self.resultbag.get_tag(dict(keys3)))
+            self.assertEqual(n_memo, len(self.resultbag._tag_memo))
+            self.assertEqual(tag, self.resultbag.get_tag({'radius': 1.5, 'flag': True}))
+            # booleans differ from numbers, also if the number is memoized first
+            self.assertNotEqual(self.resultbag.get_tag({'radius': 1.5, 'flag': 1}),
+                                self.resultbag.get_tag({'radius': 1.5, 'flag': True}))
+            self.assertNotEqual(self.resultbag.get_tag({'flag': 0}), 
+                                self.resultbag.get_tag({'flag': False}))
+
+            # resultbags with results of the text based tags keep them
+            self.resultbag.add(keys = {'radius': 1.0}, result = [{'result': 1}])
+            self.resultbag.config['key_hash'] = 1
+            rb = Resultbag('test.rbg', self.keys)
+            self.assertEqual(rb._key_hash, 1)
+            self.assertEqual(rb.get_tag({'radius': 2.0}), 
+                             hashlib.md5(rb._keys_to_string({'radius': 2.0}).encode()).hexdigest())
+            rb.reset()
+            self.assertEqual(rb._key_hash, Resultbag.KEY_HASH_VERSION)
+            rb.close()
+
         def test_filter_keys(self):
             keys = {'radius': 2.0, 'something_unimportant': 1}
             keys = self.resultbag._filter_keys(keys)
@@ -650,6 +1138,24 @@ if __name__=='__main__':
             self.assertEqual({'radius': 1.0},self.resultbag.get_keys_by_job_id(7))
             self.resultbag.release(7)
             self.assertFalse(self.resultbag.is_running(keys1))
+
+            # results of jobs and release of several jobs
+            for id in range(10, 20): self.resultbag.set_job_id({'radius': float(id)}, id)
+            self.assertTrue(self.resultbag.is_running({'radius': 15.0}))
+            with self.resultbag.batch():
+                for id in range(10, 15): 
+                    self.resultbag.add(id = id, result = [{'result': id}])
+                self.resultbag.release(list(range(10, 15)))
+            self.assertEqual(self.resultbag.get_result({'radius': 12.0}), [{'result': 12}])
+            self.assertFalse(self.resultbag.is_running({'radius': 12.0}))
+            self.assertTrue(self.resultbag.is_running({'radius': 17.0}))
+            self.assertRaises(EnvironmentError, self.resultbag.get_keys_by_job_id, 12)
+            # running jobs are not shared with other resultbags of the file
+            rb = Resultbag('test.rbg', self.keys)
+            self.assertFalse(rb.is_running({'radius': 17.0}))
+            rb.close()
+            self.resultbag.release_all()
+            self.assertFalse(self.resultbag.is_running({'radius': 17.0}))
             
         def test_handling(self):
             keys1 = {'radius': 1.0, 'something_unimportant': 1}
@@ -703,10 +1209,77 @@ if __name__=='__main__':
                     start = time.time()
 
  
+        def test_batch(self):
+            result = [{'result':1}]
+            reader = Resultbag('test.rbg',self.keys)
+            with self.resultbag.batch():
+                for i in range(10):
+                    self.resultbag.add(keys = {'radius': i}, result = result)
+                # uncommitted writes are visible to the resultbag itself
+                self.assertTrue(self.resultbag.check_result({'radius': 9}))
+                self.assertFalse(reader.check_result({'radius': 9}))
+            self.assertTrue(reader.check_result({'radius': 9}))
+            reader.close()
+            self.resultbag.remove(lambda keys: keys['radius'] < 5)
+            self.assertFalse(self.resultbag.check_result({'radius': 4}))
+            self.assertTrue(self.resultbag.check_result({'radius': 5}))
+
+        def test_cache(self):
+            field = np.zeros((100, 100, 3), dtype=complex) # 480 kB
+            rb = Resultbag('test.rbg', self.keys, cache_bytes = 2*field.nbytes)
+            for i in range(5):
+                rb.add(keys = {'radius': i}, result = [{'field': field + i}])
+            info = rb.results.cache_info()
+            self.assertEqual(info['entries'], 1)
+            self.assertTrue(info['bytes'] <= info['max_bytes'])
+            self.assertEqual(rb.get_result({'radius': 4})[0]['field'][0, 0, 0], 4)
+            self.assertEqual(rb.get_result({'radius': 0})[0]['field'][0, 0, 0], 0)
+            info = rb.results.cache_info()
+            self.assertEqual((info['hits'], info['misses']), (1, 1))
+            # streaming does not fill the cache
+            self.assertEqual(len(list(rb.results.items())), 5)
+            self.assertEqual(rb.results.cache_info()['entries'], 1)
+            rb.close()
+
+        def test_external_arrays(self):
+            field = np.arange(30000, dtype=complex).reshape(100, 100, 3)
+            result = [{'flux': np.array([1.0, 2.0]), 'field': [field], 
+                       'grid': (np.broadcast_to(np.arange(100.)[:,None], (100, 1000)),),
+                       'matrix': np.asmatrix(np.ones((100, 100)))}]
+            rb = Resultbag('test.rbg', self.keys, external_arrays = True)
+            rb.add(keys = {'radius': 1}, result = result)
+            rb.add(keys = {'radius': 2}, result = result)
+            key_dir = rb.results._key_dir(rb.get_tag({'radius': 1}))
+            self.assertEqual(len(os.listdir(key_dir)), 3)
+            rb.close()
+
+            reader = Resultbag('test.rbg', self.keys)
+            result_out = reader.get_result({'radius': 1})
+            self.assertTrue(isinstance(result_out[0]['field'][0], np.memmap))
+            self.assertTrue(np.array_equal(result_out[0]['field'][0], field))
+            self.assertTrue(np.array_equal(result_out[0]['grid'][0], result[0]['grid'][0]))
+            self.assertTrue(isinstance(result_out[0]['matrix'], np.matrix))
+            self.assertFalse(isinstance(result_out[0]['flux'], np.memmap))
+            # copy-on-write: the stored arrays are not modified
+            result_out[0]['field'][0][0, 0, 0] = -1
+            self.assertEqual(len(list(reader.results.items())), 2)
+
+            # overwritten and removed results release their files on commit 
+            with reader.batch():
+                reader.add(keys = {'radius': 1}, result = [{'flux': 1.0}])
+                self.assertEqual(len(os.listdir(key_dir)), 3)
+            self.assertFalse(os.path.isdir(key_dir))
+            self.assertEqual(reader.get_result({'radius': 2})[0]['field'][0][0, 0, 0], 0)
+            reader.remove_result({'radius': 2})
+            self.assertEqual(os.listdir(os.path.join('test.rbg.arrays', 'results')), [])
+            reader.close()
+            shutil.rmtree('test.rbg.arrays')
+
         def tearDown(self):
             self.resultbag.backup(backup_path='backup_test.rbg')
             self.resultbag.backup()
             self.resultbag.reset()
+            self.resultbag.close()
             os.remove('test.rbg')
             os.remove('backup_test.rbg')
             os.remove('test_bkp.rbg')
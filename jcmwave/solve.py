@@ -22,6 +22,7 @@ import jcmwave
 import subprocess
 import jcmwave.__private as __private
 import string
+import threading
 
 class NameSpaceHelper(object):
     pass
@@ -29,6 +30,9 @@ class NameSpaceHelper(object):
 class ProjectDataHelper(object):
     pass
 
+# jobs prepared by solve for a batch submission of solve_many (per thread)
+__batch = threading.local()
+
 def solve(project_file,  
           keys=None, 
           mode='solve',
@@ -350,6 +354,7 @@ def solve(project_file,
         
     #run embedded script when required
     produced_jcm_files = []
+    changed_jcm_files = [] # rewritten .jcm files, unchanged files are not touched
     for i_project in range(0, len(project_list)):
       project=project_list[i_project];
       if keys is not None or (project.working_dir != project.dir):
@@ -376,10 +381,13 @@ def solve(project_file,
               ex.__cause__ = None
               raise ex 
             produced_jcm_files.append(tag)
+            if __private.jcmt2jcm[tag]['changed']: changed_jcm_files.append(jcm_file_target)
 
           else: 
             if not jcm_file_src == jcm_file_target and isfile(jcm_file_src):
-              try: shutil.copyfile(jcm_file_src, jcm_file_target)
+              try: 
+                if __private.copy_if_changed(jcm_file_src, jcm_file_target):
+                  changed_jcm_files.append(jcm_file_target)
               except: 
                 raise EnvironmentError('Can`t copy file {0} to working directory.'.format(jcm_file_src))
 
@@ -417,12 +425,6 @@ def solve(project_file,
         elif logfile is not None:
             print('invalid logfile parameter: file descriptors not supported in daemon mode')
             
-        job_id = jcmwave.daemon.submit_job(
-                                    project=project_files,
-                                    mode=mode,
-                                    resources = resources,
-                                    logFile=logFile)
-#        time.sleep(10)
         backtrace = NameSpaceHelper()
         backtrace.isProjectSequence=isProjectSequence
         backtrace.files = project_files
@@ -431,12 +433,20 @@ def solve(project_file,
         backtrace.table_format = table_format
         backtrace.cartesianfields_format = cartesianfields_format
         backtrace.produced_jcm_files = produced_jcm_files
+        backtrace.changed_jcm_files = changed_jcm_files
         backtrace.clean_up = clean_up
         backtrace.working_dir_base = working_dir_base
-   
-        setattr(__private.JCMdaemon,'job_{0}'.format(job_id),backtrace)     
 
-        if resultbag is not None: resultbag.set_job_id(keys, job_id)
+        job = dict(project=project_files, mode=mode, resources=resources, 
+                   logFile=logFile)
+        batch = getattr(__batch, 'jobs', None)
+        if batch is not None:
+            # submission is done by solve_many
+            batch.append((job, backtrace, resultbag, keys))
+            return None
+
+        job_id = jcmwave.daemon.submit_job(**job)
+        __register_job(job_id, backtrace, resultbag, keys)
 
         if cache_finished_jobs:
             __private.JCMdaemon.temporaryIDs.add(job_id);
@@ -531,3 +541,156 @@ def solve(project_file,
     return results
 
 
+def solve_many(project_file, keys_list, resultbag=None, workers=None, **kwargs):
+    """
+    Prepares a job for each parameter set in keys_list as done by 
+    :func:`jcmwave.solve` in daemon mode (i.e. the templates are rendered and
+    the working directories are populated) and submits the jobs in batches of
+    SubmitJob commands. Example::
+
+        keys_list = [dict(radius=r) for r in radii]
+        job_ids = jcmwave.solve_many('project.jcmp', keys_list, 
+                                     working_dir='radius_%(radius)g')
+        results, logs = jcmwave.daemon.wait(job_ids)
+
+    :param filepath project_file: path name of a JCMwave project or post-process file
+        (or list of files for a project sequence).
+
+    :param list keys_list: list of parameter dictionaries, one for each job.
+
+    :param Resultbag resultbag: see :func:`jcmwave.solve`. 
+
+    :param int workers: number of threads preparing the working directories
+        (default: number of CPU cores, at most the number of jobs). Prepared 
+        jobs are submitted whenever the next job is not ready yet, such 
+        that the daemon starts computing while further jobs are prepared.
+
+    Further keyword arguments are passed to :func:`jcmwave.solve`. A ``working_dir``
+    may contain format specifiers ``%(<key>)...`` referring to the keys of 
+    each job, as well as ``%(index)d`` for the index of the job.
+
+    .. Note:: The jobs are only prepared in parallel if each job has its own
+        working directory (or ``temporary=True``). Otherwise, e.g. for the
+        default ``working_dir=None``, each job is prepared and submitted one 
+        after the other as done by :func:`jcmwave.solve`.
+
+    Repeated parameter sets are submitted only once if a resultbag is given,
+    their job id is 0.
+
+    :returns: List of job ids in the order of keys_list. A job id is 0, if the 
+        result is already available in (or computed for) the resultbag.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not jcmwave.daemon.daemonCheck(warn=False):
+        raise EnvironmentError('solve_many requires a running daemon (see jcmwave.daemon.startup).')
+    if not isinstance(keys_list, (list, tuple)) or not all(
+        isinstance(keys, dict) for keys in keys_list):
+        raise TypeError('keys_list -> list of dictionaries expected.')
+    if workers is None: workers = __private.__system['n_cores']
+    if not isinstance(workers, int) or workers<1:
+        raise TypeError('workers -> positive integer expected.')
+    workers = max(1, min(workers, len(keys_list)-1))
+    cache_finished_jobs = kwargs.get('cache_finished_jobs', True)
+
+    job_ids = [0]*len(keys_list)
+    pending = [] # (index in keys_list, job) of prepared jobs
+    def submit_pending():
+        submitted_ids = jcmwave.daemon.submit_jobs([job[0] for _, job in pending])
+        for (index, (job, backtrace, resultbag_, keys)), job_id in zip(
+            pending, submitted_ids):
+            __register_job(job_id, backtrace, resultbag_, keys)
+            job_ids[index] = job_id
+            if cache_finished_jobs: __private.JCMdaemon.temporaryIDs.add(job_id)
+        del pending[:]
+
+    def prepare(index):
+        return __prepare(project_file, keys_list[index], resultbag, index, kwargs)
+
+    if len(keys_list)>0:
+        # the first job is prepared alone, since it may reset the resultbag
+        job_ids[0], jobs = prepare(0)
+        pending.extend([(0, job) for job in jobs])
+
+    # jobs with the keys of a previous job are already running (job id 0)
+    indices = list(range(1, len(keys_list)))
+    if resultbag is not None:
+        tags = set([resultbag.get_tag(keys_list[0])])
+        for index in list(indices):
+            tag = resultbag.get_tag(keys_list[index])
+            if tag in tags:
+                print('%s: Results with tag %s already running' % (
+                    os.path.basename(str(project_file)), tag))
+                indices.remove(index)
+            tags.add(tag)
+
+    if __shared_working_dirs(project_file, keys_list, [0]+indices, kwargs):
+        # the files written for a job must not be overwritten before its submission
+        for index in indices:
+            if len(pending)>0: submit_pending()
+            job_ids[index], jobs = prepare(index)
+            pending.extend([(index, job) for job in jobs])
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(index, pool.submit(prepare, index)) for index in indices]
+            for index, future in futures:
+                if len(pending)>0 and not future.done(): submit_pending()
+                job_ids[index], jobs = future.result()
+                pending.extend([(index, job) for job in jobs])
+    if len(pending)>0: submit_pending()
+
+    if cache_finished_jobs and len(__private.JCMdaemon.temporaryIDs)>0:
+        jcmwave.daemon.wait(job_ids=__private.JCMdaemon.temporaryIDs, resultbag=resultbag, 
+                            verbose=False, break_condition='cache')
+    return job_ids
+
+
+def __prepare(project_file, keys, resultbag, index, kwargs):
+    """
+    Calls solve for a job of solve_many and returns its return value and the
+    list of jobs to be submitted (empty or one job).
+    """
+    kwargs = dict(kwargs)
+    kwargs['working_dir'] = __working_dir(kwargs.get('working_dir'), keys, index)
+    __batch.jobs = []
+    try:
+        return_value = solve(project_file, keys=keys, resultbag=resultbag, **kwargs)
+        return return_value, __batch.jobs
+    finally:
+        del __batch.jobs
+
+
+def __working_dir(working_dir, keys, index):
+    """
+    Returns the working directory of the job with the given index of solve_many.
+    """
+    if working_dir is not None and '%(' in working_dir:
+        substitutes = dict(keys)
+        substitutes['index'] = index
+        working_dir = working_dir % substitutes
+    return working_dir
+
+
+def __shared_working_dirs(project_file, keys_list, indices, kwargs):
+    """
+    Checks if two jobs of solve_many with the given indices share a working directory.
+    """
+    if kwargs.get('temporary', False): return False
+    if isinstance(project_file, (list, tuple)): project_file = project_file[-1]
+    project_dir = os.path.dirname(os.path.abspath(project_file))
+    working_dirs = set()
+    for index in indices:
+        working_dir = __working_dir(kwargs.get('working_dir'), keys_list[index], index)
+        if working_dir is None: working_dir = '.'
+        working_dir = os.path.normcase(os.path.abspath(os.path.join(project_dir, working_dir)))
+        if working_dir in working_dirs: return True
+        working_dirs.add(working_dir)
+    return False
+
+
+def __register_job(job_id, backtrace, resultbag, keys):
+    """
+    Stores the backtrace of a submitted job needed by jcmwave.daemon.wait.
+    """
+    setattr(__private.JCMdaemon,'job_{0}'.format(job_id),backtrace)     
+    if resultbag is not None: resultbag.set_job_id(keys, job_id)